@@ -0,0 +1,389 @@
+import functools
+import hashlib
+import inspect
+import math
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, jsonify, request
+
+from shared_memory import SharedFile
+
+
+# Raised when a route group is saturated (its wait queue is full, or the wait
+# timed out); answered with 503 and Retry-After
+class Overloaded(Exception):
+    def __init__(self, group, retry_after):
+        super().__init__(f"{group} is overloaded")
+        self.group = group
+        self.retry_after = retry_after
+
+
+# Raised when a client ran out of tokens for a rate-limited route; answered
+# with 429 and Retry-After
+class RateLimited(Exception):
+    def __init__(self, name, retry_after):
+        super().__init__(f"rate limit exceeded for {name}")
+        self.name = name
+        self.retry_after = retry_after
+
+
+# Token bucket arithmetic shared by both backends: refill `tokens` (last
+# updated at `updated`) at `rate` per second up to `burst`, then take one.
+# Returns (tokens, seconds until a token is available or 0 if one was taken).
+def _take_token(tokens, updated, now, rate, burst):
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+# Admission state of one worker process: a counted slot pool with a bounded
+# wait queue per route group, and token buckets keyed by client.
+class LocalAdmissionState:
+    def __init__(self, groups, max_clients=100000):
+        self.groups = groups
+        self.max_clients = max_clients
+        self.reset_after_fork()
+
+    def reset_after_fork(self):
+        self._condition = threading.Condition()
+        self._active = {group: 0 for group in self.groups}
+        self._waiting = {group: 0 for group in self.groups}
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._buckets_lock = threading.Lock()
+
+    def acquire(self, group, timeout):
+        limit, queue_size = self.groups[group]
+        with self._condition:
+            if self._active[group] < limit:
+                self._active[group] += 1
+                return True
+            if self._waiting[group] >= queue_size:
+                return False
+            self._waiting[group] += 1
+            try:
+                admitted = self._condition.wait_for(
+                    lambda: self._active[group] < limit, timeout
+                )
+                if admitted:
+                    self._active[group] += 1
+                return admitted
+            finally:
+                self._waiting[group] -= 1
+
+    def release(self, group):
+        with self._condition:
+            self._active[group] -= 1
+            self._condition.notify_all()
+
+    def take_token(self, key, rate, burst):
+        now = time.monotonic()
+        with self._buckets_lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens, retry_after = _take_token(tokens, updated, now, rate, burst)
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+    def status(self):
+        with self._condition:
+            return {
+                group: {"active": self._active[group], "waiting": self._waiting[group]}
+                for group in self.groups
+            }
+
+
+# Admission state shared by the worker processes of one server through a
+# SharedFile. Slot and queue counts are kept per worker pid, so the slots of a
+# worker that died are reclaimed; token buckets live in a fixed-size hash
+# table where the stalest entries are reused. Waiting for a slot polls. The
+# file layout follows `groups`: use a new path when they change.
+class SharedAdmissionState:
+    MAX_WORKERS = 64
+    BUCKET_SLOTS = 65536
+    PROBES = 8
+    POLL_SECONDS = 0.005
+
+    def __init__(self, path, groups):
+        self.path = path
+        self.groups = groups
+        self._group_index = {group: i for i, group in enumerate(groups)}
+        # per worker: pid, then (active, waiting) per group
+        self._worker = struct.Struct(f"q{2 * len(groups)}i")
+        # per bucket: key hash, tokens, updated (wall clock)
+        self._bucket = struct.Struct("Qdd")
+        self._buckets_offset = self.MAX_WORKERS * self._worker.size
+        self._shared = SharedFile(
+            path, self._buckets_offset + self.BUCKET_SLOTS * self._bucket.size
+        )
+        self._slot = None
+
+    def reset_after_fork(self):
+        self._shared.reset_after_fork()
+        self._slot = None
+
+    def _read_worker(self, slot):
+        values = self._worker.unpack_from(self._shared.map, slot * self._worker.size)
+        return values[0], list(values[1:])
+
+    def _write_worker(self, slot, pid, counts):
+        self._worker.pack_into(self._shared.map, slot * self._worker.size, pid, *counts)
+
+    # This process' row in the worker table (call with the lock held)
+    def _own_slot(self):
+        pid = os.getpid()
+        if self._slot is not None and self._read_worker(self._slot)[0] == pid:
+            return self._slot
+        free = None
+        for slot in range(self.MAX_WORKERS):
+            slot_pid, counts = self._read_worker(slot)
+            if slot_pid == pid:
+                self._slot = slot
+                return slot
+            if free is None and (slot_pid == 0 or not _alive(slot_pid)):
+                free = slot
+        if free is None:
+            raise RuntimeError("admission state: too many worker processes")
+        self._write_worker(free, pid, [0] * (2 * len(self.groups)))
+        self._slot = free
+        return free
+
+    # Sum of (active, waiting) for `group` over the workers; with
+    # `check_alive` the rows of dead workers are cleared and left out
+    def _totals(self, index, check_alive=False):
+        active = waiting = 0
+        for slot in range(self.MAX_WORKERS):
+            pid, counts = self._read_worker(slot)
+            if pid == 0:
+                continue
+            if check_alive and not _alive(pid):
+                self._write_worker(slot, 0, [0] * len(counts))
+                continue
+            active += counts[2 * index]
+            waiting += counts[2 * index + 1]
+        return active, waiting
+
+    # Whether a slot is free, looking for slots leaked by dead workers only
+    # when the group seems saturated
+    def _has_room(self, index, limit):
+        active, waiting = self._totals(index)
+        if active >= limit:
+            active, waiting = self._totals(index, check_alive=True)
+        return active < limit, waiting
+
+    def _add(self, slot, index, active=0, waiting=0):
+        pid, counts = self._read_worker(slot)
+        counts[2 * index] += active
+        counts[2 * index + 1] += waiting
+        self._write_worker(slot, pid, counts)
+
+    def acquire(self, group, timeout):
+        limit, queue_size = self.groups[group]
+        index = self._group_index[group]
+        with self._shared.locked():
+            slot = self._own_slot()
+            room, waiting = self._has_room(index, limit)
+            if room:
+                self._add(slot, index, active=1)
+                return True
+            if waiting >= queue_size:
+                return False
+            self._add(slot, index, waiting=1)
+
+        deadline = time.monotonic() + timeout
+        while True:
+            time.sleep(self.POLL_SECONDS)
+            with self._shared.locked():
+                slot = self._own_slot()
+                if self._has_room(index, limit)[0]:
+                    self._add(slot, index, active=1, waiting=-1)
+                    return True
+                if time.monotonic() >= deadline:
+                    self._add(slot, index, waiting=-1)
+                    return False
+
+    def release(self, group):
+        with self._shared.locked():
+            self._add(self._own_slot(), self._group_index[group], active=-1)
+
+    def take_token(self, key, rate, burst):
+        key_hash = int.from_bytes(
+            hashlib.blake2b(key.encode(), digest_size=8).digest(), "big"
+        ) or 1
+        now = time.time()
+        start = key_hash % self.BUCKET_SLOTS
+        with self._shared.locked() as shared_map:
+            target = None
+            stalest = None
+            for probe in range(self.PROBES):
+                slot = (start + probe) % self.BUCKET_SLOTS
+                offset = self._buckets_offset + slot * self._bucket.size
+                slot_hash, tokens, updated = self._bucket.unpack_from(
+                    shared_map, offset
+                )
+                if slot_hash == key_hash:
+                    target = (offset, tokens, updated)
+                    break
+                if stalest is None or updated < stalest[1]:
+                    stalest = (offset, updated)
+            if target is None:
+                target = (stalest[0], burst, now)
+            offset, tokens, updated = target
+            tokens, retry_after = _take_token(tokens, updated, now, rate, burst)
+            self._bucket.pack_into(shared_map, offset, key_hash, tokens, now)
+        return retry_after
+
+    def status(self):
+        with self._shared.locked():
+            totals = {group: self._totals(i) for group, i in self._group_index.items()}
+        return {
+            group: {"active": active, "waiting": waiting}
+            for group, (active, waiting) in totals.items()
+        }
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# Admission control for the API routes.
+#
+# Routes are put in groups (@admit("listings")), each allowed `limit`
+# concurrent requests plus `queue_size` waiting ones for up to
+# `queue_timeout` seconds. Past that they fail fast with 503 and Retry-After
+# instead of piling up on worker threads while the database is slow, and
+# routes outside the saturated group keep being served. @rate_limit(name)
+# routes take a token from the client's bucket (`rate` per second, up to
+# `burst`) and answer 429 when it is empty. Clients are keyed by
+# request.remote_addr: behind a proxy, set TRUSTED_PROXIES so that is the
+# client's address rather than the proxy's.
+class AdmissionController:
+    def __init__(self, state, queue_timeout=1.0, retry_after=1, rate_limits=None,
+                 app=None):
+        self.state = state
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.rate_limits = rate_limits or {}
+        self.rejected = {group: 0 for group in state.groups}
+        self.rate_limited = {name: 0 for name in self.rate_limits}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.register_error_handler(Overloaded, overloaded_response)
+        app.register_error_handler(RateLimited, rate_limited_response)
+
+    @property
+    def groups(self):
+        return self.state.groups
+
+    def acquire(self, group):
+        if not self.state.acquire(group, self.queue_timeout):
+            with self._lock:
+                self.rejected[group] += 1
+            raise Overloaded(group, self.retry_after)
+
+    def release(self, group):
+        self.state.release(group)
+
+    def check_rate(self, name, client):
+        limit = self.rate_limits.get(name)
+        if limit is None:
+            return
+        rate, burst = limit
+        retry_after = self.state.take_token(f"{name}:{client}", rate, burst)
+        if retry_after:
+            with self._lock:
+                self.rate_limited[name] += 1
+            raise RateLimited(name, math.ceil(retry_after))
+
+    def status(self):
+        groups = self.state.status()
+        with self._lock:
+            for group, stats in groups.items():
+                stats["rejected"] = self.rejected[group]
+            rate_limited = dict(self.rate_limited)
+        return {"groups": groups, "rate_limited": rate_limited}
+
+
+# The 503 of every "try again later" refusal: admission control, a full
+# password hashing pool, a group commit timeout
+def busy_response(retry_after):
+    response = jsonify({"message": "Server is busy, please try again later"})
+    response.headers["Retry-After"] = str(retry_after)
+    return response, 503
+
+
+def overloaded_response(error):
+    return busy_response(error.retry_after)
+
+
+def rate_limited_response(error):
+    response = jsonify({"message": "Too many requests, please try again later"})
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, 429
+
+
+# Run the view within the admission limits of `group` (put it right under
+# the route decorator, above @read_replica and @jwt_required()). Streamed
+# responses release their slot once the view has returned. Async views are
+# run by Flask on a loop of their own per request, so waiting for a slot
+# blocks only that request.
+def admit(group):
+    def decorator(view):
+        if inspect.iscoroutinefunction(view):
+
+            @functools.wraps(view)
+            async def async_wrapper(*args, **kwargs):
+                controller = current_app.extensions.get("admission")
+                if controller is None or group not in controller.groups:
+                    return await view(*args, **kwargs)
+                controller.acquire(group)
+                try:
+                    return await view(*args, **kwargs)
+                finally:
+                    controller.release(group)
+
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            controller = current_app.extensions.get("admission")
+            if controller is None or group not in controller.groups:
+                return view(*args, **kwargs)
+            controller.acquire(group)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                controller.release(group)
+
+        return wrapper
+
+    return decorator
+
+
+# Token-bucket rate limit `name` per client, checked before admission
+def rate_limit(name):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            controller = current_app.extensions.get("admission")
+            if controller is not None:
+                controller.check_rate(name, request.remote_addr)
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,95 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import Future
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from background import LazyThread
+from db_config import async_engine_options
+
+# asyncio driver used for each backend
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def async_database_uri(uri):
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver configured for {backend}")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+
+# AsyncEngine/AsyncSession for the async read views.
+#
+# Under a WSGI server Flask runs every async view in a fresh event loop, while
+# asyncio connections (and the engine's first-connect lock) are bound to the
+# loop that created them. So the engine lives on one long-running loop in a
+# background thread, where its pool is shared by every request; views hand
+# their queries to it with `await async_db.run(fn)`. The loop and engine are
+# created on first use, the loop running in a LazyThread.
+#
+# The engine gets the pool settings of db_config.engine_options() (or
+# `engine_options` when given), and `instrument(sync_engine)` is called once
+# it is created, e.g. to attach SQLInstrumentation.
+class AsyncDatabase:
+    def __init__(self, uri, instrument=None, **engine_options):
+        self.uri = uri
+        self.instrument = instrument
+        self.engine_options = engine_options
+        self.reset_after_fork()
+
+    # The loop thread doesn't survive a fork, the child starts its own
+    def reset_after_fork(self):
+        self.engine = None
+        self._sessionmaker = None
+        self._loop = None
+        self._lock = threading.Lock()
+        self._thread = LazyThread(self._run_loop, "async-db")
+
+    def _run_loop(self):
+        self._loop.run_forever()
+
+    def _start(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            uri = async_database_uri(self.uri)
+            self.engine = create_async_engine(
+                uri, **(self.engine_options or async_engine_options(uri))
+            )
+            if self.instrument is not None:
+                self.instrument(self.engine.sync_engine)
+            self._sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+            self._loop = asyncio.new_event_loop()
+            self._thread.start()
+
+    async def _call(self, fn):
+        async with self._sessionmaker() as session:
+            return await fn(session)
+
+    # Run `await fn(session)` on the database loop and return its result. It
+    # runs in a copy of the caller's context, so its statements are
+    # attributed to the caller's request (see SQLInstrumentation).
+    async def run(self, fn):
+        if self._loop is None:
+            self._start()
+        context = contextvars.copy_context()
+        future = Future()
+
+        def start():
+            task = self._loop.create_task(self._call(fn), context=context)
+            task.add_done_callback(lambda task: _set_future_result(future, task))
+
+        self._loop.call_soon_threadsafe(start)
+        return await asyncio.wrap_future(future)
+
+
+def _set_future_result(future, task):
+    if task.cancelled():
+        future.cancel()
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(task.result())
@@ -0,0 +1,154 @@
+from flask import Blueprint, jsonify, request
+from flask_cors import cross_origin
+from flask_jwt_extended import (
+    create_access_token,
+    jwt_required,
+    get_current_user,
+    get_jwt,
+)
+
+from admission import admit, busy_response, rate_limit
+from extensions import jwt, password_hasher, repository, user_cache
+from hashing import HashingPoolBusy
+from replicas import read_replica, set_request_identity
+
+# Registration, login, logout and the JWT callbacks
+bp = Blueprint("auth", __name__)
+
+
+# Checked by flask_jwt_extended for every @jwt_required() route
+@jwt.token_in_blocklist_loader
+def check_if_token_revoked(jwt_header, jwt_payload):
+    return repository.is_token_revoked(jwt_payload["jti"])
+
+
+@jwt.revoked_token_loader
+def revoked_token_response(jwt_header, jwt_payload):
+    return jsonify({"message": "Token has been revoked"}), 401
+
+
+@bp.app_errorhandler(HashingPoolBusy)
+def hashing_pool_busy(error):
+    return busy_response(1)
+
+
+# Tokens carry the user id as their subject; `user` is a repository dict, or
+# a Users row in scripts that build tokens themselves
+@jwt.user_identity_loader
+def user_identity_lookup(user):
+    return str(user["id"] if isinstance(user, dict) else user.id)
+
+
+# Resolve the token subject to the user (as a dict, without the password),
+# served from user_cache so authenticated requests don't query the users table
+@jwt.user_lookup_loader
+def user_lookup_callback(jwt_header, jwt_payload):
+    try:
+        user_id = int(jwt_payload["sub"])
+    except (TypeError, ValueError):
+        return None
+    set_request_identity(user_id)
+
+    user = user_cache.get(user_id)
+    if user is None:
+        user = repository.get_user(user_id)
+        if user is None:
+            return None
+        user_cache.set(user_id, user)
+    return user
+
+
+@jwt.user_lookup_error_loader
+def user_lookup_error_response(jwt_header, jwt_payload):
+    return jsonify({"message": "User not found"}), 404
+
+
+# Registration endpoint
+@bp.route("/api/register", methods=["POST"])
+@rate_limit("register")
+@admit("auth")
+def register():
+    data = request.get_json()
+    name = data.get("name")
+    email = data.get("email")
+    gender = data.get("gender")
+    password = data.get("password")
+
+    if not email or not password:
+        return jsonify({"message": "email and password are required"}), 400
+
+    if repository.get_user_by_email(email):
+        return jsonify({"message": "email already exists!"}), 400
+
+    hashed_password = password_hasher.hash(password)
+    new_user = repository.add_user(name, email, gender, hashed_password)
+    user_cache.set(new_user["id"], new_user)
+
+    access_token = create_access_token(identity=new_user)
+    return (
+        jsonify(
+            {"message": "User created successfully!", "access_token": access_token}
+        ),
+        201,
+    )
+
+
+#  return jsonify({'message': 'User created successfully!'}), 201
+
+
+# Login endpoint
+@bp.route("/api/login", methods=["POST"])
+@rate_limit("login")
+@admit("auth")
+@cross_origin()
+def login():
+    data = request.get_json()
+    email = data.get("email")
+    password = data.get("password")
+
+    if not email or not password:
+        return jsonify({"message": "Email and password are required"}), 400
+
+    user = repository.get_user_by_email(email)
+    matches, new_hash = (
+        password_hasher.verify(user.pop("password"), password)
+        if user
+        else (False, None)
+    )
+
+    if matches:
+        if new_hash:
+            repository.set_user_password(user["id"], new_hash)
+        #   return jsonify(user.as_dict())
+        user_cache.set(user["id"], user)
+        access_token = create_access_token(identity=user)
+        return jsonify({"access_token": access_token}), 200
+    else:
+        return jsonify({"message": "Invalid credentials"}), 401
+
+
+#  if not user or not check_password_hash(user.password, password):
+#      return jsonify({"message": "Invalid username or password"}), 401
+
+#  access_token = create_access_token(identity=user)
+#  return jsonify({"access_token": access_token}), 200
+
+
+# Token revocation endpoint
+@bp.route("/api/logout", methods=["DELETE"])
+@admit("writes")
+@jwt_required()
+def logout():
+    token = get_jwt()
+    jti = token["jti"]  # Extracting JWT ID
+    repository.revoke_token(jti, token.get("exp"))
+    return jsonify({"message": "Successfully logged out"}), 200
+
+
+# Protected route example
+@bp.route("/api/protected", methods=["GET"])
+@read_replica
+@jwt_required()
+def protected():
+    current_user = get_current_user()
+    return jsonify(logged_in_as=current_user), 200
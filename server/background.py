@@ -0,0 +1,29 @@
+import threading
+
+
+# A daemon thread running `target`, started by the first start() call rather
+# than at create_app(): threads don't survive a fork, and servers that preload
+# the app fork their workers after it, so the thread must be started in the
+# worker. After a fork the child calls reset_after_fork() (see
+# factory._reset_after_fork) and the next start() starts its own thread.
+# start() also restarts the thread if it died.
+class LazyThread:
+    def __init__(self, target, name):
+        self.target = target
+        self.name = name
+        self.reset_after_fork()
+
+    def reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self.target, name=self.name, daemon=True
+            )
+            self._thread.start()
@@ -0,0 +1,3 @@
+# Benchmarks for the API (factory.create_app()). Run them from the server directory,
+# e.g. `python -m benchmarks.login_load`; they default to a throwaway SQLite
+# database unless DATABASE_URL is set.
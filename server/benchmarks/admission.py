@@ -0,0 +1,127 @@
+# Latency of a cheap route while another route group is saturated, with and
+# without admission control. --heavy-clients clients keep sending
+# POST /api/products/batch (the "writes" group) to a pool of --threads worker
+# threads while another user times GET /api/products (the "listings" group)
+# on their 20 products.
+# Without admission control the batches take every worker thread and the
+# listing requests queue behind them; with it the writes group is held to
+# its limit and queue, the overflow is answered 503 at once (the clients
+# then wait for Retry-After, as well-behaved clients do) and listings keep
+# their threads.
+#
+# The response cache is disabled so every listing reaches the database.
+#
+#   python -m benchmarks.admission --threads 8 --heavy-clients 32
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+)
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+
+from benchmarks.common import ThreadedServer, latency_summary  # noqa: E402
+from extensions import db  # noqa: E402
+from factory import create_app  # noqa: E402
+
+MODES = {
+    "no admission control": {"ADMISSION_CONTROL": False},
+    "admission control": {"ADMISSION_CONTROL": True},
+}
+
+
+def run(app, headers, reader_headers, args):
+    server = ThreadedServer(app, args.threads)
+    stop = threading.Event()
+    lock = threading.Lock()
+    heavy = {"ok": 0, "rejected": 0, "latencies": []}
+    batch = [{"name": "heavy", "price": i} for i in range(args.batch_size)]
+
+    def heavy_loop():
+        while not stop.is_set():
+            start = time.perf_counter()
+            response = server.request(
+                "post", "/api/products/batch", headers=headers, json=batch
+            )
+            with lock:
+                rejected = response.status_code == 503
+                if rejected:
+                    heavy["rejected"] += 1
+                else:
+                    heavy["ok"] += 1
+                    heavy["latencies"].append((time.perf_counter() - start) * 1000)
+            if rejected:
+                stop.wait(float(response.headers["Retry-After"]))
+
+    clients = [threading.Thread(target=heavy_loop) for _ in range(args.heavy_clients)]
+    for client in clients:
+        client.start()
+    time.sleep(0.5)
+
+    latencies = []
+    deadline = time.perf_counter() + args.duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        server.request("get", "/api/products", headers=reader_headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.01)
+
+    stop.set()
+    for client in clients:
+        client.join()
+    server.shutdown()
+    return {
+        "GET /api/products": latency_summary(latencies),
+        "POST /api/products/batch": dict(
+            latency_summary(heavy["latencies"]),
+            ok_per_second=round(heavy["ok"] / (args.duration + 0.5), 1),
+            rejected_per_second=round(heavy["rejected"] / (args.duration + 0.5), 1),
+        ),
+    }
+
+
+def register(client, name):
+    response = client.post(
+        "/api/register",
+        json={"name": name, "email": f"{name}@example.com", "gender": "x",
+              "password": "bench-password"},
+    )
+    return {"Authorization": f"Bearer {response.get_json()['access_token']}"}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--heavy-clients", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+    # the default admission limits are derived from the worker thread count
+    os.environ["WORKER_THREADS"] = str(args.threads)
+
+    setup_app = create_app({"RATE_LIMITS": {}})
+    with setup_app.app_context():
+        db.drop_all()
+        db.create_all()
+    client = setup_app.test_client()
+    headers = register(client, "bench")
+    reader_headers = register(client, "reader")
+    client.post("/api/products/batch", headers=reader_headers,
+                json=[{"name": f"product {i}", "price": i} for i in range(20)])
+
+    results = {}
+    for mode, config in MODES.items():
+        app = create_app(dict(config, RESPONSE_CACHE_MAX_SIZE=0))
+        results[mode] = run(app, headers, reader_headers, args)
+        admission = app.extensions.get("admission")
+        if admission is not None:
+            results[mode]["limits"] = app.config["ADMISSION_LIMITS"]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
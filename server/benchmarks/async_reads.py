@@ -0,0 +1,83 @@
+# Throughput of the listing endpoints served by the sync views and by the
+# async (ASYNC_READS) views, at the same worker thread count.
+#
+# The response cache is disabled so every request reaches the database.
+#
+#   python -m benchmarks.async_reads --threads 8 --clients 32
+import argparse
+import os
+import tempfile
+
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+)
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+# Measure the app itself, not the admission limits and rate limits
+os.environ.setdefault("ADMISSION_CONTROL", "0")
+
+import products  # noqa: E402
+from benchmarks.common import ThreadedServer, run_endpoint  # noqa: E402
+from caching import ResponseCache  # noqa: E402
+from extensions import db  # noqa: E402
+from factory import create_app  # noqa: E402
+
+app = create_app()
+SYNC_VIEWS = {
+    "products.get_user_products": products.get_user_products,
+    "products.get_all_products_with_owners": products.get_all_products_with_owners,
+}
+ASYNC_VIEWS = {
+    "products.get_user_products": products.get_user_products_async,
+    "products.get_all_products_with_owners": (
+        products.get_all_products_with_owners_async
+    ),
+}
+
+
+def setup(products):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    client = app.test_client()
+    response = client.post(
+        "/api/register",
+        json={"name": "bench", "email": "bench@example.com", "gender": "x",
+              "password": "bench-password"},
+    )
+    headers = {"Authorization": f"Bearer {response.get_json()['access_token']}"}
+    client.post("/api/products/batch", headers=headers,
+                json=[{"name": f"product {i}", "price": i} for i in range(products)])
+    return headers
+
+
+def run(views, url, headers, threads, clients, duration):
+    app.view_functions.update(views)
+    server = ThreadedServer(app, threads)
+    result = run_endpoint(
+        server, "get", lambda i: (url, {"headers": headers}),
+        concurrency=clients, duration=duration,
+    )
+    server.shutdown()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    headers = setup(args.products)
+    app.extensions["response_cache"] = ResponseCache(maxsize=0)
+    for url in ("/api/products", "/api/all-products?limit=50"):
+        for name, views in (("sync", SYNC_VIEWS), ("async", ASYNC_VIEWS)):
+            result = run(
+                views, url, headers, args.threads, args.clients, args.duration
+            )
+            print(f"{url:<28} {name:>5}: {result}")
+
+
+if __name__ == "__main__":
+    main()
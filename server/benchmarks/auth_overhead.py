@@ -0,0 +1,90 @@
+# Per-request cost of authenticating a bearer token.
+#
+# "decode" times the token verification alone (what @jwt_required() runs
+# before the blocklist and user lookups) for the token formats before and
+# after the compact claims, with and without the verified-token cache.
+# "request" times GET /api/protected end to end with the cache off and on.
+#
+#   python -m benchmarks.auth_overhead --requests 5000
+import argparse
+import os
+import tempfile
+import time
+
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+)
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+# Measure the app itself, not the admission limits and rate limits
+os.environ.setdefault("ADMISSION_CONTROL", "0")
+
+from flask_jwt_extended import create_access_token, decode_token  # noqa: E402
+
+from caching import TTLCache  # noqa: E402
+from extensions import db  # noqa: E402
+from factory import create_app  # noqa: E402
+from models import Users  # noqa: E402
+
+app = create_app()
+
+
+def per_call_us(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return round((time.perf_counter() - start) / n * 1e6, 1)
+
+
+def set_cache_size(size):
+    app.extensions["jwt_decode_cache"] = TTLCache(maxsize=size)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    n = args.requests
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    client = app.test_client()
+    response = client.post(
+        "/api/register",
+        json={"name": "bench", "email": "bench@example.com", "gender": "x",
+              "password": "bench-password"},
+    )
+    compact = response.get_json()["access_token"]
+
+    with app.test_request_context():
+        user = Users.query.filter_by(email="bench@example.com").one()
+        # the identity login() used to put in every token, with nbf
+        app.config["JWT_ENCODE_NBF"] = True
+        legacy = create_access_token(identity=user, additional_claims={
+            "sub": user.as_dict()
+        })
+        app.config["JWT_ENCODE_NBF"] = False
+
+        print(f"token size: legacy {len(legacy)} bytes, compact {len(compact)} bytes")
+        results = {}
+        for name, token in (("legacy", legacy), ("compact", compact)):
+            set_cache_size(0)
+            results[f"decode {name}"] = per_call_us(lambda: decode_token(token), n)
+        set_cache_size(10000)
+        results["decode compact, cached"] = per_call_us(
+            lambda: decode_token(compact), n
+        )
+
+    headers = {"Authorization": f"Bearer {compact}"}
+    for name, size in (("uncached", 0), ("cached", 10000)):
+        set_cache_size(size)
+        results[f"request GET /api/protected, {name}"] = per_call_us(
+            lambda: client.get("/api/protected", headers=headers), n
+        )
+
+    for name, us in results.items():
+        print(f"{name:<40} {us:>8} us")
+
+
+if __name__ == "__main__":
+    main()
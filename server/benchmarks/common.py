@@ -0,0 +1,89 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+# Dispatches requests to a fixed pool of worker threads, the way a threaded
+# WSGI server (e.g. gunicorn --threads N) serves them. Each worker thread has
+# its own test client.
+class ThreadedServer:
+    def __init__(self, app, threads):
+        self.app = app
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+        self._local = threading.local()
+
+    def _handle(self, method, *args, **kwargs):
+        if not hasattr(self._local, "client"):
+            self._local.client = self.app.test_client()
+        return getattr(self._local.client, method)(*args, **kwargs)
+
+    def submit(self, method, *args, **kwargs):
+        return self._executor.submit(self._handle, method, *args, **kwargs)
+
+    def request(self, method, *args, **kwargs):
+        return self.submit(method, *args, **kwargs).result()
+
+    def shutdown(self):
+        self._executor.shutdown()
+
+
+# Request count, throughput and latency percentiles (ms) of a run
+def latency_summary(latencies, elapsed=None):
+    summary = {"requests": len(latencies)}
+    if elapsed is not None:
+        summary["rps"] = round(len(latencies) / elapsed, 1)
+    for pct in (50, 95, 99):
+        summary[f"p{pct}_ms"] = round(percentile(latencies, pct), 2)
+    return summary
+
+
+# Send requests to one endpoint from `concurrency` clients, each sending its
+# next request once it has the response to the previous one: `requests`
+# requests in all, or as many as fit in `duration` seconds.
+# make_request(i) returns the (url, test client kwargs) of the i-th request;
+# answers other than `expected` are counted as errors.
+def run_endpoint(server, method, make_request, expected=200, requests=None,
+                 concurrency=16, duration=None):
+    indexes = iter(range(requests)) if requests is not None else itertools.count()
+    lock = threading.Lock()
+    stop = threading.Event()
+    latencies = []
+    errors = []
+
+    def client_loop():
+        while not stop.is_set():
+            with lock:
+                i = next(indexes, None)
+            if i is None:
+                return
+            url, kwargs = make_request(i)
+            start = time.perf_counter()
+            response = server.request(method, url, **kwargs)
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code != expected:
+                    errors.append(response.status_code)
+
+    clients = [threading.Thread(target=client_loop) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for client in clients:
+        client.start()
+    if duration is not None:
+        stop.wait(duration)
+        stop.set()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - started
+
+    summary = latency_summary(latencies, elapsed)
+    summary["errors"] = len(errors)
+    summary["error_statuses"] = sorted(set(errors))
+    return summary
@@ -0,0 +1,120 @@
+# Peak Python memory and time of a --size-mb image upload through
+# PUT /api/products/<id>/image (streamed to disk in chunks) against reading
+# the whole body first (request.get_data(), what a request.files upload
+# amounts to), and of serving it back, whole and as a 1 MiB Range. Requests
+# are run straight through the WSGI app with wsgi.input reading from a
+# file, so only the server side is measured (tracemalloc).
+#
+#   python -m benchmarks.images --size-mb 50
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+directory = tempfile.mkdtemp()
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(directory, "bench.db")
+)
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+os.environ.setdefault("ADMISSION_CONTROL", "0")
+os.environ["IMAGE_STORAGE_DIR"] = os.path.join(directory, "images")
+
+from flask import request  # noqa: E402
+from werkzeug.test import EnvironBuilder  # noqa: E402
+
+from extensions import db  # noqa: E402
+from factory import create_app  # noqa: E402
+
+
+def measure(app, environ):
+    statuses = []
+    tracemalloc.start()
+    started = time.perf_counter()
+    body = app.wsgi_app(
+        environ, lambda status, headers, exc_info=None: statuses.append(status)
+    )
+    size = 0
+    for chunk in body:
+        size += len(chunk)
+    if hasattr(body, "close"):
+        body.close()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "status": statuses[0],
+        "ms": round(elapsed * 1000, 1),
+        "peak_mib": round(peak / 2**20, 2),
+        "response_bytes": size,
+    }
+
+
+def upload_environ(url, headers, path):
+    environ = EnvironBuilder(
+        url, method="PUT", headers=headers, content_type="image/png",
+        content_length=os.path.getsize(path),
+    ).get_environ()
+    environ["wsgi.input"] = open(path, "rb")
+    return environ
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=50)
+    args = parser.parse_args()
+    size = args.size_mb * 2**20
+
+    app = create_app({"IMAGE_MAX_BYTES": 2 * size})
+
+    # the naive alternative, for comparison
+    @app.route("/bench/buffered-upload", methods=["PUT"])
+    def buffered_upload():
+        data = request.get_data()
+        with open(os.path.join(directory, "buffered"), "wb") as file:
+            file.write(data)
+        return "", 204
+
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    response = client.post(
+        "/api/register",
+        json={"name": "bench", "email": "bench@example.com", "gender": "x",
+              "password": "bench-password"},
+    )
+    headers = {"Authorization": f"Bearer {response.get_json()['access_token']}"}
+    client.post("/api/products", headers=headers, json={"name": "p", "price": 1})
+
+    # a PNG signature followed by incompressible bytes
+    path = os.path.join(directory, "upload.png")
+    with open(path, "wb") as file:
+        file.write(b"\x89PNG\r\n\x1a\n")
+        remaining = size - 8
+        while remaining > 0:
+            chunk = os.urandom(min(remaining, 2**20))
+            file.write(chunk)
+            remaining -= len(chunk)
+
+    url = "/api/products/1/image"
+    results = {
+        "upload, streamed": measure(app, upload_environ(url, headers, path)),
+        "upload, buffered": measure(
+            app, upload_environ("/bench/buffered-upload", headers, path)
+        ),
+        "GET whole image": measure(
+            app, EnvironBuilder(url, headers=headers).get_environ()
+        ),
+        "GET Range 1 MiB": measure(
+            app,
+            EnvironBuilder(
+                url, headers=dict(headers, Range=f"bytes=0-{2**20 - 1}")
+            ).get_environ(),
+        ),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+# Load test for every route of the API: throughput and p50/p95/p99 latency
+# per endpoint, written as JSON so runs can be compared between commits.
+#
+# The database is seeded with --users/--products rows, then each endpoint
+# gets --requests requests from --concurrency clients, served by a pool of
+# --threads worker threads (see benchmarks.common.ThreadedServer). With
+# --baseline the run is compared to an earlier result file and exits with
+# status 1 when an endpoint's latency or throughput regressed by more than
+# --threshold, or it answered more unexpected statuses than before.
+#
+#   python -m benchmarks.load --output base.json
+#   python -m benchmarks.load --baseline base.json --threshold 0.2
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+)
+# Measure the app itself, not the admission limits and rate limits
+os.environ.setdefault("ADMISSION_CONTROL", "0")
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+from benchmarks.common import ThreadedServer, run_endpoint  # noqa: E402
+from changes import ensure_change_feed_schema  # noqa: E402
+from commands import seed_database  # noqa: E402
+from extensions import db  # noqa: E402
+from factory import create_app  # noqa: E402
+from models import Users  # noqa: E402
+from search import ensure_search_schema  # noqa: E402
+
+app = create_app()
+
+BENCH_USER = {
+    "name": "bench",
+    "email": "bench@example.com",
+    "gender": "x",
+    "password": "bench-password",
+}
+
+# Metrics compared in --baseline mode; latencies regress when they grow,
+# throughput when it drops
+LATENCY_METRICS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+# Shared state of a run: the bench user's token, the products it owns and
+# fresh tokens for /api/logout
+class Fixtures:
+    def __init__(self, server, requests):
+        response = server.request("post", "/api/register", json=BENCH_USER)
+        token = response.get_json()["access_token"]
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.counter = itertools.count()
+
+        batch_size = app.config["PRODUCTS_BATCH_MAX_SIZE"]
+        self.product_ids = []
+        # one product per DELETE request, plus the one PUT keeps updating
+        for start in range(0, requests + 1, batch_size):
+            count = min(batch_size, requests + 1 - start)
+            response = server.request(
+                "post",
+                "/api/products/batch",
+                headers=self.headers,
+                json=[
+                    {"name": f"bench product {start + i}", "price": i}
+                    for i in range(count)
+                ],
+            )
+            self.product_ids += [item["id"] for item in response.get_json()["results"]]
+        self.updated_id = self.product_ids.pop()
+
+        # change feed position after the fixtures, see changes.py
+        self.changes_cursor = None
+        while True:
+            response = server.request(
+                "get",
+                "/api/products/changes",
+                headers=self.headers,
+                query_string={"since": self.changes_cursor or ""},
+            ).get_json()
+            self.changes_cursor = response["cursor"]
+            if not response["has_more"]:
+                break
+
+        with app.app_context():
+            user = Users.query.filter_by(email=BENCH_USER["email"]).one()
+            self.logout_tokens = [
+                create_access_token(identity=user) for _ in range(requests)
+            ]
+
+    def unique(self):
+        return next(self.counter)
+
+    def auth(self, token):
+        return {"Authorization": f"Bearer {token}"}
+
+
+# name -> (method, request(fixtures, i) -> (url, kwargs), expected status)
+def endpoints():
+    def register(f, i):
+        n = f.unique()
+        return "/api/register", {
+            "json": {
+                "name": f"load{n}",
+                "email": f"load{n}@example.com",
+                "gender": "x",
+                "password": "load-password",
+            }
+        }
+
+    def login(f, i):
+        return "/api/login", {
+            "json": {
+                "email": BENCH_USER["email"],
+                "password": BENCH_USER["password"],
+            }
+        }
+
+    def logout(f, i):
+        return "/api/logout", {"headers": f.auth(f.logout_tokens[i])}
+
+    def authenticated(url):
+        return lambda f, i: (url, {"headers": f.headers})
+
+    def create_product(f, i):
+        return "/api/products", {
+            "headers": f.headers,
+            "json": {"name": f"created {f.unique()}", "price": 1.5},
+        }
+
+    def update_product(f, i):
+        return f"/api/products/{f.updated_id}", {
+            "headers": f.headers,
+            "json": {"price": i},
+        }
+
+    def delete_product(f, i):
+        return f"/api/products/{f.product_ids[i]}", {"headers": f.headers}
+
+    def product_changes(f, i):
+        return "/api/products/changes", {
+            "headers": f.headers,
+            "query_string": {"since": f.changes_cursor},
+        }
+
+    return {
+        "POST /api/register": ("post", register, 201),
+        "POST /api/login": ("post", login, 200),
+        "GET /api/protected": ("get", authenticated("/api/protected"), 200),
+        "POST /api/products": ("post", create_product, 201),
+        "GET /api/products": ("get", authenticated("/api/products"), 200),
+        "GET /api/all-products?limit=100": (
+            "get",
+            authenticated("/api/all-products?limit=100"),
+            200,
+        ),
+        "GET /api/products/search": (
+            "get",
+            authenticated("/api/products/search?q=product&limit=20"),
+            200,
+        ),
+        "GET /api/products/changes?since=": ("get", product_changes, 200),
+        "GET /api/stats": ("get", authenticated("/api/stats"), 200),
+        "GET /api/stats/owners?limit=100": (
+            "get",
+            authenticated("/api/stats/owners?limit=100"),
+            200,
+        ),
+        "PUT /api/products/<id>": ("put", update_product, 200),
+        "DELETE /api/products/<id>": ("delete", delete_product, 200),
+        "DELETE /api/logout": ("delete", logout, 200),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def setup_database(users, products):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        with db.engine.begin() as connection:
+            ensure_search_schema(connection)
+            ensure_change_feed_schema(connection)
+            seed_database(connection, users, products)
+
+
+# Regressions of `result` against `baseline`: [(endpoint, metric, old, new)]
+def regressions(baseline, result, threshold):
+    found = []
+    for name, new in result["endpoints"].items():
+        old = baseline["endpoints"].get(name)
+        if old is None:
+            continue
+        for metric in LATENCY_METRICS:
+            if new[metric] > old[metric] * (1 + threshold):
+                found.append((name, metric, old[metric], new[metric]))
+        if new["rps"] < old["rps"] * (1 - threshold):
+            found.append((name, "rps", old["rps"], new["rps"]))
+        if new["errors"] > old["errors"]:
+            found.append((name, "errors", old["errors"], new["errors"]))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500,
+                        help="requests per endpoint")
+    parser.add_argument("--endpoint", action="append", dest="only",
+                        help="only run endpoints containing this text")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed regression as a fraction (default 0.2)")
+    args = parser.parse_args()
+
+    setup_database(args.users, args.products)
+    server = ThreadedServer(app, args.threads)
+    fixtures = Fixtures(server, args.requests)
+
+    result = {
+        "commit": git_commit(),
+        "database": app.config["SQLALCHEMY_DATABASE_URI"].split(":")[0],
+        "users": args.users,
+        "products": args.products,
+        "threads": args.threads,
+        "concurrency": args.concurrency,
+        "endpoints": {},
+    }
+    for name, (method, make_request, expected) in endpoints().items():
+        if args.only and not any(text in name for text in args.only):
+            continue
+        result["endpoints"][name] = stats = run_endpoint(
+            server,
+            method,
+            lambda i, make_request=make_request: make_request(fixtures, i),
+            expected,
+            requests=args.requests,
+            concurrency=args.concurrency,
+        )
+        print(f"{name:<32} {json.dumps(stats)}", file=sys.stderr)
+    server.shutdown()
+    app.extensions["password_hasher"].shutdown()
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        found = regressions(baseline, result, args.threshold)
+        for name, metric, old, new in found:
+            print(f"REGRESSION {name} {metric}: {old} -> {new}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
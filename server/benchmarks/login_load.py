@@ -0,0 +1,113 @@
+# Product endpoint latency while /api/login is pegged.
+#
+# Requests are dispatched to a fixed pool of worker threads. A set of
+# clients hammers /api/login while one probe client polls GET /api/products
+# and records its latency, once with inline hashing and once with the
+# hashing pool.
+#
+#   python -m benchmarks.login_load --threads 4 --login-clients 16
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+)
+# Measure the app itself, not the admission limits and rate limits
+os.environ.setdefault("ADMISSION_CONTROL", "0")
+
+from benchmarks.common import ThreadedServer, latency_summary  # noqa: E402
+from extensions import db  # noqa: E402
+from factory import create_app  # noqa: E402
+from hashing import PasswordHasher  # noqa: E402
+
+app = create_app()
+
+
+def setup():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    client = app.test_client()
+    response = client.post(
+        "/api/register",
+        json={"name": "bench", "email": "bench@example.com", "gender": "x",
+              "password": "bench-password"},
+    )
+    token = response.get_json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    for i in range(20):
+        client.post("/api/products", headers=headers,
+                    json={"name": f"product {i}", "price": i})
+    return headers
+
+
+def run(hasher, headers, threads, login_clients, duration):
+    app.extensions["password_hasher"] = hasher
+    server = ThreadedServer(app, threads)
+    stop = threading.Event()
+    login_statuses = []
+
+    def login_loop():
+        while not stop.is_set():
+            response = server.request(
+                "post", "/api/login",
+                json={"email": "bench@example.com", "password": "bench-password"},
+            )
+            login_statuses.append(response.status_code)
+            if response.status_code == 503:
+                time.sleep(0.005)
+
+    loaders = [threading.Thread(target=login_loop) for _ in range(login_clients)]
+    for loader in loaders:
+        loader.start()
+    time.sleep(0.5)  # let the login load build up
+
+    latencies = []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        server.request("get", "/api/products", headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.01)
+
+    stop.set()
+    for loader in loaders:
+        loader.join()
+    server.shutdown()
+    hasher.shutdown()
+
+    return dict(
+        latency_summary(latencies),
+        logins_ok=login_statuses.count(200),
+        logins_503=login_statuses.count(503),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--login-clients", type=int, default=16)
+    parser.add_argument("--hash-workers", type=int, default=2)
+    parser.add_argument("--max-pending", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    headers = setup()
+    modes = {
+        "idle": (PasswordHasher(workers=0), 0),
+        "inline": (PasswordHasher(workers=0), args.login_clients),
+        "pool": (
+            PasswordHasher(workers=args.hash_workers, max_pending=args.max_pending),
+            args.login_clients,
+        ),
+    }
+    for name, (hasher, login_clients) in modes.items():
+        result = run(hasher, headers, args.threads, login_clients, args.duration)
+        print(f"{name:>6}: {result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# Cost of read replica routing, against two local SQLite files, the replica
+# being a copy made with SQLite's backup API to stand in for replication
+# (with two Postgres instances set DATABASE_URL and REPLICA_DATABASE_URL and
+# run the load benchmark instead). Times GET /api/all-products?limit=100:
+#
+#   replica        routed to the replica
+#   primary only   an app without a replica, for comparison
+#   replica down   the replica fails: the first request falls back to the
+#                  primary, the next ones skip the replica until
+#                  REPLICA_RETRY_SECONDS have passed
+#
+# with the router counters of each run. The response cache is disabled so
+# every request reaches the database.
+#
+#   python -m benchmarks.replica_routing --requests 500
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+directory = tempfile.mkdtemp()
+PRIMARY = os.path.join(directory, "primary.db")
+REPLICA = os.path.join(directory, "replica.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + PRIMARY
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+os.environ.setdefault("ADMISSION_CONTROL", "0")
+
+from benchmarks.common import latency_summary  # noqa: E402
+from extensions import db  # noqa: E402
+from factory import create_app  # noqa: E402
+from replicas import REPLICA_BIND  # noqa: E402
+
+
+def replicate():
+    source = sqlite3.connect(PRIMARY)
+    target = sqlite3.connect(REPLICA)
+    source.backup(target)
+    source.close()
+    target.close()
+
+
+def timed(client, headers, requests):
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        client.get("/api/all-products?limit=100", headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latency_summary(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--products", type=int, default=1000)
+    args = parser.parse_args()
+
+    primary_app = create_app({"RESPONSE_CACHE_MAX_SIZE": 0, "RATE_LIMITS": {}})
+    with primary_app.app_context():
+        db.create_all()
+    client = primary_app.test_client()
+    response = client.post(
+        "/api/register",
+        json={"name": "bench", "email": "bench@example.com", "gender": "x",
+              "password": "bench-password"},
+    )
+    headers = {"Authorization": f"Bearer {response.get_json()['access_token']}"}
+    for start in range(0, args.products, 1000):
+        client.post(
+            "/api/products/batch",
+            headers=headers,
+            json=[
+                {"name": f"product {i}", "price": i}
+                for i in range(start, min(start + 1000, args.products))
+            ],
+        )
+    replicate()
+
+    # no recent write by the bench user in this app: reads go to the replica
+    app = create_app(
+        {
+            "RESPONSE_CACHE_MAX_SIZE": 0,
+            "RATE_LIMITS": {},
+            "REPLICA_DATABASE_URI": "sqlite:///" + REPLICA,
+        }
+    )
+    router = app.extensions["replica_router"]
+    client = app.test_client()
+    results = {"replica": timed(client, headers, args.requests)}
+    results["replica"]["routing"] = router.status()
+
+    results["primary only"] = timed(
+        primary_app.test_client(), headers, args.requests
+    )
+
+    # an empty replica: every query fails with "no such table"
+    with app.app_context():
+        db.engines[REPLICA_BIND].dispose()
+    os.remove(REPLICA)
+    results["replica down"] = timed(client, headers, args.requests)
+    results["replica down"]["routing"] = router.status()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
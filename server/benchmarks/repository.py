@@ -0,0 +1,115 @@
+# Throughput and latency of the product CRUD endpoints on each storage
+# backend (REPOSITORY=sqlalchemy, REPOSITORY=memory, see repository.py): what
+# a test suite or benchmark run gains by swapping in the in-memory
+# repository. The bench user owns --products products; the response cache
+# is disabled so every listing reaches the repository.
+#
+#   python -m benchmarks.repository --products 2000
+import argparse
+import itertools
+import json
+import os
+import tempfile
+
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+)
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+os.environ.setdefault("ADMISSION_CONTROL", "0")
+
+from benchmarks.common import ThreadedServer, run_endpoint  # noqa: E402
+from extensions import db  # noqa: E402
+from factory import create_app  # noqa: E402
+
+
+def endpoints(product_ids):
+    counter = itertools.count()
+    updated_id = product_ids[-1]
+    return {
+        "POST /api/products": (
+            "post",
+            lambda i: (
+                "/api/products",
+                {"json": {"name": f"p{next(counter)}", "price": 1}},
+            ),
+            201,
+        ),
+        "GET /api/products": ("get", lambda i: ("/api/products", {}), 200),
+        "GET /api/all-products?limit=100": (
+            "get",
+            lambda i: (
+                "/api/all-products?limit=100"
+                f"&after_id={product_ids[i % len(product_ids)]}",
+                {},
+            ),
+            200,
+        ),
+        "PUT /api/products/<id>": (
+            "put",
+            lambda i: (f"/api/products/{updated_id}", {"json": {"price": i}}),
+            200,
+        ),
+        "DELETE /api/products/<id>": (
+            "delete",
+            lambda i: (f"/api/products/{product_ids[i]}", {}),
+            200,
+        ),
+    }
+
+
+def with_headers(request, headers):
+    url, kwargs = request
+    return url, dict(kwargs, headers=headers)
+
+
+def run(backend, args):
+    app = create_app(
+        {"REPOSITORY": backend, "RESPONSE_CACHE_MAX_SIZE": 0, "RATE_LIMITS": {}}
+    )
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    client = app.test_client()
+    response = client.post(
+        "/api/register",
+        json={"name": "bench", "email": "bench@example.com", "gender": "x",
+              "password": "bench-password"},
+    )
+    headers = {"Authorization": f"Bearer {response.get_json()['access_token']}"}
+
+    repository = app.extensions["repository"]
+    with app.app_context():
+        for i in range(args.products):
+            repository.add_product({"name": f"product {i}", "price": i, "user_id": 1})
+        product_ids = [product["id"] for product in repository.all_products()]
+
+    server = ThreadedServer(app, args.threads)
+    results = {}
+    for name, (method, make_request, expected) in endpoints(product_ids).items():
+        results[name] = run_endpoint(
+            server,
+            method,
+            lambda i, make_request=make_request: with_headers(make_request(i), headers),
+            expected,
+            requests=min(args.requests, len(product_ids)),
+            concurrency=args.concurrency,
+        )
+    server.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500,
+                        help="requests per endpoint")
+    args = parser.parse_args()
+
+    results = {backend: run(backend, args) for backend in ("sqlalchemy", "memory")}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
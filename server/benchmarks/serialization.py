@@ -0,0 +1,110 @@
+# Time to turn product listings into a JSON response body: the previous
+# path (ORM instances or rows, a dict built per row in Python, stdlib json)
+# against the compiled row serializers and the orjson provider.
+#
+# The query runs once per size; only serialization is timed.
+#
+#   python -m benchmarks.serialization --rows 10000 100000
+import argparse
+import os
+import tempfile
+import time
+
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+)
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+
+import products  # noqa: E402
+from commands import seed_database  # noqa: E402
+from extensions import db  # noqa: E402
+from factory import create_app  # noqa: E402
+from models import Products  # noqa: E402
+
+
+def orm_products_as_dicts(instances):
+    return [
+        {
+            "id": product.id,
+            "name": product.name,
+            "description": product.description,
+            "price": product.price,
+        }
+        for product in instances
+    ]
+
+
+def rows_with_owner_as_dicts(rows):
+    return [
+        {
+            "id": row.id,
+            "name": row.name,
+            "description": row.description,
+            "price": row.price,
+            "owner": row.owner,
+        }
+        for row in rows
+    ]
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(min(timings), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app()
+    stdlib_json = DefaultJSONProvider(app)
+    fast_json = app.json
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        with db.engine.begin() as connection:
+            seed_database(connection, users=100, products=max(args.rows))
+
+        for size in args.rows:
+            # /api/products: ORM instances before, column-only rows now
+            orm_query = db.select(Products).limit(size)
+            instances = db.session.execute(orm_query).scalars().all()
+            columns = products.user_products_query(None).selected_columns
+            rows = db.session.execute(
+                db.select(*columns).limit(size)
+            ).all()
+            # /api/all-products
+            listing = db.session.execute(
+                products.all_products_query().limit(size)
+            ).all()
+
+            cases = {
+                "products    before": lambda: stdlib_json.response(
+                    orm_products_as_dicts(instances)
+                ),
+                "products    after": lambda: fast_json.response(
+                    products.user_product_as_dict.many(rows)
+                ),
+                "all-products before": lambda: stdlib_json.response(
+                    rows_with_owner_as_dicts(listing)
+                ),
+                "all-products after": lambda: fast_json.response(
+                    products.product_with_owner_as_dict.many(listing)
+                ),
+            }
+            for name, fn in cases.items():
+                print(f"{size:>7} rows  {name:<20} {best_of(args.repeat, fn):>8} ms")
+            db.session.expunge_all()
+
+
+if __name__ == "__main__":
+    main()
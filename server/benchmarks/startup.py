@@ -0,0 +1,98 @@
+# Worker startup cost: cold import + create_app() time and the latency of the
+# first and second request (a failed login: one user lookup), each measured
+# in a fresh interpreter. "wsgi" is the app production servers load,
+# "manage" the one the flask CLI loads (with Flask-Migrate and the
+# maintenance commands); the output also tells whether Alembic was imported.
+# The median of --runs runs is reported as JSON so it can be tracked between
+# commits.
+#
+#   python -m benchmarks.startup --runs 5
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Runs in the child interpreter; prints one JSON line
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+module = __import__(sys.argv[1])
+app = module.app
+loaded = time.perf_counter()
+client = app.test_client()
+timings = []
+for _ in range(2):
+    request_start = time.perf_counter()
+    response = client.post(
+        "/api/login", json={"email": "nobody@example.com", "password": "x"}
+    )
+    timings.append(time.perf_counter() - request_start)
+    assert response.status_code == 401, response.status_code
+print(json.dumps({
+    "import_ms": (loaded - start) * 1000,
+    "first_request_ms": timings[0] * 1000,
+    "second_request_ms": timings[1] * 1000,
+    "alembic_loaded": "alembic" in sys.modules,
+    "modules": len(sys.modules),
+}))
+"""
+
+SCHEMA = """
+from extensions import db
+from factory import create_app
+with create_app().app_context():
+    db.create_all()
+"""
+
+ENTRY_POINTS = ("wsgi", "manage")
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def probe(entry_point, env):
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, entry_point],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=env,
+        cwd=SERVER_DIR,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault(
+        "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    )
+    env.setdefault("PASSWORD_HASH_WORKERS", "0")
+    subprocess.run(
+        [sys.executable, "-c", SCHEMA], check=True, env=env, cwd=SERVER_DIR
+    )
+
+    result = {}
+    for entry_point in ENTRY_POINTS:
+        runs = [probe(entry_point, env) for _ in range(args.runs)]
+        result[entry_point] = {
+            "import_ms": round(statistics.median(r["import_ms"] for r in runs), 1),
+            "first_request_ms": round(
+                statistics.median(r["first_request_ms"] for r in runs), 2
+            ),
+            "second_request_ms": round(
+                statistics.median(r["second_request_ms"] for r in runs), 2
+            ),
+            "alembic_loaded": runs[0]["alembic_loaded"],
+            "modules": runs[0]["modules"],
+        }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
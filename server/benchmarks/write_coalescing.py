@@ -0,0 +1,104 @@
+# Throughput and latency of POST /api/products and DELETE /api/logout with
+# one commit per request and with WRITE_COALESCING (group commit), at the
+# same worker thread count, plus the batch sizes the group commit reached.
+# Commit cost depends on the disk: point DATABASE_URL at the real database
+# (or a SQLite file on the disk it would use) to measure it.
+#
+#   python -m benchmarks.write_coalescing --threads 16 --requests 2000
+import argparse
+import json
+import os
+import tempfile
+
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+)
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+# Measure the app itself, not the admission limits and rate limits
+os.environ.setdefault("ADMISSION_CONTROL", "0")
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+from benchmarks.common import ThreadedServer, run_endpoint  # noqa: E402
+from extensions import db  # noqa: E402
+from factory import create_app  # noqa: E402
+from models import Users  # noqa: E402
+
+MODES = {
+    "commit per request": {},
+    "group commit": {"WRITE_COALESCING": True},
+}
+
+
+def run(app, method, requests, make_request, expected, threads):
+    server = ThreadedServer(app, threads)
+    result = run_endpoint(
+        server, method, make_request, expected, requests=requests,
+        concurrency=threads,
+    )
+    server.shutdown()
+    return result
+
+
+def batch_stats(app):
+    committer = app.extensions.get("group_commit")
+    if committer is None:
+        return None
+    stats = {}
+    for table in ("products", "revoked_token"):
+        rows, batches = committer.batch_rows.totals((table,))
+        if batches:
+            stats[table] = {"batches": batches, "avg_rows": round(rows / batches, 1)}
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_app = create_app()
+    with setup_app.app_context():
+        db.drop_all()
+        db.create_all()
+    client = setup_app.test_client()
+    response = client.post(
+        "/api/register",
+        json={"name": "bench", "email": "bench@example.com", "gender": "x",
+              "password": "bench-password"},
+    )
+    headers = {"Authorization": f"Bearer {response.get_json()['access_token']}"}
+
+    results = {}
+    for mode, config in MODES.items():
+        app = create_app(config)
+        with app.app_context():
+            user = Users.query.filter_by(email="bench@example.com").one()
+            logout_tokens = [
+                create_access_token(identity=user) for _ in range(args.requests)
+            ]
+        results[mode] = {
+            "POST /api/products": run(
+                app, "post", args.requests,
+                lambda i: ("/api/products", {
+                    "headers": headers, "json": {"name": f"p{i}", "price": i},
+                }),
+                201,
+                args.threads,
+            ),
+            "DELETE /api/logout": run(
+                app, "delete", args.requests,
+                lambda i: ("/api/logout", {
+                    "headers": {"Authorization": f"Bearer {logout_tokens[i]}"},
+                }),
+                200,
+                args.threads,
+            ),
+            "batches": batch_stats(app),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
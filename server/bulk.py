@@ -0,0 +1,128 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from sqlalchemy import insert
+
+# Product fields read by an import, in COPY column order
+IMPORT_FIELDS = ("name", "description", "price")
+EXPORT_FIELDS = ("id", "name", "description", "price", "user_id")
+FORMATS = ("csv", "ndjson")
+
+
+class BulkImportError(Exception):
+    def __init__(self, line, message):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+        self.message = message
+
+
+# Parse an import file incrementally, yielding (line number, record) with the
+# IMPORT_FIELDS of each row. `stream` is a text file object. CSV files need a
+# header row naming the columns; an empty description is read as null.
+def read_products(stream, fmt):
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        missing = {"name", "price"} - set(reader.fieldnames or ())
+        if missing:
+            raise BulkImportError(1, f"missing columns: {', '.join(sorted(missing))}")
+        for row in reader:
+            try:
+                price = float(row["price"])
+            except (TypeError, ValueError):
+                raise BulkImportError(reader.line_num, "price must be a number")
+            yield reader.line_num, {
+                "name": row["name"],
+                "description": row.get("description") or None,
+                "price": price,
+            }
+        return
+
+    for line_num, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            raise BulkImportError(line_num, "invalid JSON")
+        if not isinstance(item, dict):
+            raise BulkImportError(line_num, "each line must be a JSON object")
+        yield line_num, {field: item.get(field) for field in IMPORT_FIELDS}
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+# Write `records` (from read_products) for `user_id` in batches of
+# `batch_size` rows, checking each with `validate(record) -> error or None`.
+# Postgres (psycopg2) loads each batch with COPY FROM STDIN, other databases
+# with a multi-row executemany INSERT. Runs in the caller's transaction, so an
+# invalid row raises BulkImportError and nothing is kept once it rolls back.
+# Returns the number of rows written.
+def import_products(connection, table, records, user_id, validate, batch_size):
+    copy = connection.dialect.name == "postgresql" and (
+        connection.dialect.driver == "psycopg2"
+    )
+    count = 0
+    for batch in batched(records, batch_size):
+        rows = []
+        for line, record in batch:
+            error = validate(record)
+            if error:
+                raise BulkImportError(line, error)
+            rows.append(record)
+        if copy:
+            _copy_rows(connection, table, rows, user_id)
+        else:
+            connection.execute(
+                insert(table), [dict(row, user_id=user_id) for row in rows]
+            )
+        count += len(rows)
+    return count
+
+
+def _copy_rows(connection, table, rows, user_id):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        # an unquoted empty field is NULL in COPY's CSV format
+        description = row["description"]
+        writer.writerow(
+            (row["name"], "" if description is None else description, row["price"],
+             user_id)
+        )
+    buffer.seek(0)
+    columns = ", ".join(IMPORT_FIELDS + ("user_id",))
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table.name} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+    finally:
+        cursor.close()
+
+
+# Render the rows of `result` (a yield_per result with the EXPORT_FIELDS
+# columns) as CSV or NDJSON, one text chunk per partition
+def export_products(result, fmt, dumps=json.dumps):
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        for partition in result.partitions():
+            writer.writerows(partition)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+        return
+
+    for partition in result.partitions():
+        yield "".join(
+            dumps(dict(zip(EXPORT_FIELDS, row))) + "\n" for row in partition
+        )
@@ -0,0 +1,162 @@
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from shared_memory import SharedFile
+
+
+# Thread-safe, size-bounded LRU cache whose entries expire `ttl` seconds
+# after they were stored. Hit and miss counts are kept for diagnostics.
+# With `maxweight`, entries are also evicted while the total of the
+# `weight` given to set() (e.g. bytes) is above it.
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=60.0, maxweight=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxweight = maxweight
+        self.hits = 0
+        self.misses = 0
+        self.weight = 0
+        self._data = OrderedDict()  # key -> (expires_at, value, weight)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._data[key]
+                self.weight -= entry[2]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None, weight=0):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.weight -= old[2]
+            self._data[key] = (expires_at, value, weight)
+            self.weight += weight
+            while len(self._data) > self.maxsize or (
+                self.maxweight is not None and self.weight > self.maxweight
+            ):
+                self.weight -= self._data.popitem(last=False)[1][2]
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self.weight -= entry[2]
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "weight": self.weight,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Generation counter of each ResponseCache scope, in this process
+class LocalGenerations:
+    def __init__(self):
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def reset_after_fork(self):
+        self._lock = threading.Lock()
+
+    def get(self, scope):
+        return self._generations.get(scope, 0)
+
+    def bump(self, scope):
+        with self._lock:
+            self._generations[scope] = self._generations.get(scope, 0) + 1
+
+
+# Generation counters shared by the worker processes of one host through a
+# SharedFile, so a write handled by one worker invalidates the cached
+# responses of all of them. Scopes are
+# hashed to a fixed number of counters: two scopes sharing one only
+# invalidate each other more often. Reads don't lock; bumps take flock.
+class SharedGenerations:
+    SLOTS = 65536
+
+    def __init__(self, path):
+        self._counter = struct.Struct("Q")
+        self._shared = SharedFile(path, self.SLOTS * self._counter.size)
+
+    def reset_after_fork(self):
+        self._shared.reset_after_fork()
+
+    # A stable hash: hash() of a str differs between processes
+    def _offset(self, scope):
+        slot = zlib.crc32(repr(scope).encode()) % self.SLOTS
+        return slot * self._counter.size
+
+    def get(self, scope):
+        return self._counter.unpack_from(self._shared.open(), self._offset(scope))[0]
+
+    def bump(self, scope):
+        offset = self._offset(scope)
+        with self._shared.locked() as shared_map:
+            value = self._counter.unpack_from(shared_map, offset)[0]
+            self._counter.pack_into(shared_map, offset, value + 1)
+
+
+# Cache of rendered responses, grouped in scopes that are invalidated as a
+# whole (e.g. every page of a listing once one of its products changes).
+# Invalidation bumps the scope generation, stale entries then age out.
+# With SharedGenerations an invalidation reaches every worker of the host;
+# other hosts keep serving their entries until the TTL expires them.
+#
+# Take the key with `key()` *before* reading the data to cache: a write that
+# lands in between then invalidates the entry instead of being masked by it.
+#
+# Memory is bounded by the total body size, `max_bytes`, on top of the entry
+# count; a body over `max_entry_bytes` (e.g. an unpaginated listing of a
+# large catalog) is served but not kept.
+class ResponseCache:
+    def __init__(self, maxsize=1024, ttl=60.0, generations=None,
+                 max_bytes=None, max_entry_bytes=None):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl, maxweight=max_bytes)
+        self.max_entry_bytes = max_entry_bytes
+        self.generations = generations or LocalGenerations()
+
+    def key(self, scope, key=None):
+        return (scope, self.generations.get(scope), key)
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    # `size`: bytes held by `value`
+    def set(self, key, value, size=0):
+        if self.max_entry_bytes is not None and size > self.max_entry_bytes:
+            return
+        self._entries.set(key, value, weight=size)
+
+    def invalidate(self, scope):
+        self.generations.bump(scope)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        stats = self._entries.stats()
+        stats["bytes"] = stats.pop("weight")
+        return stats
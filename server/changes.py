@@ -0,0 +1,228 @@
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import get_current_user, jwt_required
+from sqlalchemy import and_, delete, exists, func, select, text, tuple_
+from sqlalchemy.orm import aliased
+
+from admission import admit
+from extensions import db
+from models import ProductChange, Products, Users
+from products import product_with_owner_as_dict, user_product_as_dict
+from replicas import read_replica
+from serializers import row_serializer
+
+# Incremental sync of product listings: triggers on products append a row to
+# product_changes for every inserted, updated or deleted product, whatever
+# wrote it (API handlers, group commit, bulk imports, the CLI), and
+# GET /api/products/changes?since=<cursor> returns the products changed
+# since the cursor, so a client's sync cost follows the churn instead of the
+# catalog size.
+#
+# Changes are ordered by (txid, seq). On SQLite writes are serialized, seq
+# follows commit order and txid is 0. On Postgres seq is allocated before
+# commit, so concurrent transactions can commit out of order: rows also
+# record their transaction id, and the feed only returns rows of
+# transactions older than the oldest one still running (the snapshot's
+# xmin), which can't get new rows anymore. A cursor never skips a change.
+#
+# The "product changes" migration creates the triggers;
+# ensure_change_feed_schema() does the same for databases built with
+# db.create_all().
+SQLITE_CHANGE_FEED_SCHEMA = [
+    """CREATE TRIGGER IF NOT EXISTS product_changes_insert AFTER INSERT ON products
+    BEGIN
+        INSERT INTO product_changes (product_id, user_id, deleted)
+        VALUES (new.id, new.user_id, 0);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_changes_update AFTER UPDATE ON products
+    BEGIN
+        INSERT INTO product_changes (product_id, user_id, deleted)
+        VALUES (new.id, new.user_id, 0);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_changes_delete AFTER DELETE ON products
+    BEGIN
+        INSERT INTO product_changes (product_id, user_id, deleted)
+        VALUES (old.id, old.user_id, 1);
+    END""",
+]
+
+# Statement-level triggers: one INSERT ... SELECT per statement from its
+# transition table, also for batch writes and COPY
+POSTGRESQL_CHANGE_FEED_SCHEMA = [
+    """CREATE OR REPLACE FUNCTION record_product_changes() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO product_changes (txid, product_id, user_id, deleted)
+            SELECT txid_current(), id, user_id, true FROM old_rows ORDER BY id;
+        ELSE
+            INSERT INTO product_changes (txid, product_id, user_id, deleted)
+            SELECT txid_current(), id, user_id, false FROM new_rows ORDER BY id;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS product_changes_insert ON products",
+    """CREATE TRIGGER product_changes_insert AFTER INSERT ON products
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION record_product_changes()""",
+    "DROP TRIGGER IF EXISTS product_changes_update ON products",
+    """CREATE TRIGGER product_changes_update AFTER UPDATE ON products
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION record_product_changes()""",
+    "DROP TRIGGER IF EXISTS product_changes_delete ON products",
+    """CREATE TRIGGER product_changes_delete AFTER DELETE ON products
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION record_product_changes()""",
+]
+
+# Products written before the triggers existed, once
+BACKFILL_CHANGES = """INSERT INTO product_changes (product_id, user_id)
+SELECT id, user_id FROM products
+WHERE NOT EXISTS (SELECT 1 FROM product_changes)
+ORDER BY id"""
+
+bp = Blueprint("changes", __name__)
+
+product_changes = ProductChange.__table__
+
+
+def ensure_change_feed_schema(connection):
+    statements = {
+        "sqlite": SQLITE_CHANGE_FEED_SCHEMA,
+        "postgresql": POSTGRESQL_CHANGE_FEED_SCHEMA,
+    }.get(connection.dialect.name, [])
+    for statement in statements:
+        connection.execute(text(statement))
+    connection.execute(text(BACKFILL_CHANGES))
+
+
+def format_cursor(txid, seq):
+    return f"{txid}-{seq}"
+
+
+# (txid, seq) of a cursor, None if it is malformed
+def parse_cursor(cursor):
+    try:
+        txid, seq = cursor.split("-")
+        return int(txid), int(seq)
+    except ValueError:
+        return None
+
+
+# Changes after `after` = (txid, seq), oldest first, with the current
+# columns of their product and, for the feed of all products, its owner's
+# name. The product is matched on its owner too, so a product that took the
+# id of a deleted one (ids of databases created before products had
+# sqlite_autoincrement may be reused) never shows under the old owner's
+# change; the columns are NULL once it is deleted.
+def changes_query(dialect_name, user_id=None, after=(0, 0), limit=1000):
+    owner = aliased(Users)
+    query = (
+        select(
+            product_changes.c.txid,
+            product_changes.c.seq,
+            product_changes.c.product_id,
+            product_changes.c.deleted,
+            Products.id,
+            Products.name,
+            Products.description,
+            Products.price,
+            Products.img_path,
+            owner.name.label("owner"),
+        )
+        .select_from(product_changes)
+        .outerjoin(
+            Products,
+            and_(
+                Products.id == product_changes.c.product_id,
+                Products.user_id == product_changes.c.user_id,
+            ),
+        )
+        .outerjoin(owner, owner.id == Products.user_id)
+        .order_by(product_changes.c.txid, product_changes.c.seq)
+        .limit(limit)
+    )
+    if user_id is not None:
+        query = query.where(product_changes.c.user_id == user_id)
+    if dialect_name == "postgresql":
+        return query.where(
+            tuple_(product_changes.c.txid, product_changes.c.seq) > tuple_(*after),
+            product_changes.c.txid
+            < func.txid_snapshot_xmin(func.txid_current_snapshot()),
+        )
+    # txid is always 0: a plain range on seq (SQLite only uses the first
+    # column of a row value comparison to search the index)
+    return query.where(product_changes.c.txid == 0, product_changes.c.seq > after[1])
+
+
+# Log rows superseded by a later change of the same product (and owner, see
+# changes_query()): the later row carries the product's current state, so
+# deleting them loses nothing
+def superseded_changes_query():
+    later = aliased(product_changes)
+    return delete(product_changes).where(
+        exists().where(
+            later.c.product_id == product_changes.c.product_id,
+            later.c.user_id == product_changes.c.user_id,
+            later.c.seq > product_changes.c.seq,
+        )
+    )
+
+
+# Products changed since `since` (a cursor from a previous response; left
+# out, the feed starts from the beginning and doubles as a paginated full
+# sync). `scope=user` (default) follows the caller's products like
+# GET /api/products, `scope=all` the whole catalog like /api/all-products.
+# Returns the changed products (current columns), the ids of deleted ones,
+# the cursor to pass next and whether more changes are waiting; a product
+# changed several times in the page is listed once, as of its latest change.
+# A change whose product is gone by now is left out: its deletion comes
+# later in the feed.
+@bp.route("/api/products/changes", methods=["GET"])
+@admit("listings")
+@read_replica
+@jwt_required()
+def get_product_changes():
+    scope = request.args.get("scope", "user")
+    if scope not in ("user", "all"):
+        return jsonify({"message": "scope must be 'user' or 'all'"}), 400
+    since = request.args.get("since")
+    after = (0, 0)
+    if since:
+        after = parse_cursor(since)
+        if after is None:
+            return jsonify({"message": "Invalid cursor"}), 400
+    max_limit = current_app.config["PRODUCTS_PAGE_MAX_LIMIT"]
+    limit = request.args.get("limit", max_limit, type=int)
+    if limit < 1:
+        return jsonify({"message": "limit must be a positive integer"}), 400
+    limit = min(limit, max_limit)
+
+    user_id = get_current_user()["id"] if scope == "user" else None
+    query = changes_query(db.engine.dialect.name, user_id, after, limit)
+    rows = db.session.execute(query).all()
+
+    listing = user_product_as_dict if scope == "user" else product_with_owner_as_dict
+    serialize = row_serializer(query, listing.fields)
+    latest = {}
+    for row in rows:
+        latest.pop(row.product_id, None)
+        latest[row.product_id] = row
+
+    last = (rows[-1].txid, rows[-1].seq) if rows else after
+    return (
+        jsonify(
+            {
+                "changed": [
+                    serialize(row)
+                    for row in latest.values()
+                    if not row.deleted and row.id is not None
+                ],
+                "deleted": [
+                    product_id for product_id, row in latest.items() if row.deleted
+                ],
+                "cursor": format_cursor(*last),
+                "has_more": len(rows) == limit,
+            }
+        ),
+        200,
+    )
@@ -0,0 +1,332 @@
+import contextlib
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from bulk import (
+    FORMATS,
+    BulkImportError,
+    export_products,
+    import_products,
+    read_products,
+)
+from changes import (
+    changes_query,
+    ensure_change_feed_schema,
+    superseded_changes_query,
+)
+from extensions import db, revocation_cache
+from images import Image, unreferenced_images
+from models import Products, RevokedToken, Users
+from products import (
+    all_products_query,
+    compact_dumps,
+    delete_owned_products_query,
+    export_products_query,
+    export_result,
+    owned_product_prices_query,
+    product_fields_error,
+    user_products_query,
+)
+from query_plans import check_query_plans
+from search import ensure_search_schema, search_products_query
+from stats import rebuild_product_stats
+
+
+# Maintenance commands for the `flask` CLI, plus Flask-Migrate's `flask db`.
+# Only the CLI imports this module, so servers never load Alembic.
+def init_cli(app):
+    from flask_migrate import Migrate
+
+    Migrate(app, db)
+    for command in (
+        prune_revoked_tokens,
+        import_products_command,
+        export_products_command,
+        check_query_plans_command,
+        rebuild_product_stats_command,
+        prune_images,
+        make_thumbnails,
+        prune_product_changes,
+    ):
+        app.cli.add_command(command)
+
+
+# Delete revoked tokens whose expiry has passed
+@click.command("prune-revoked-tokens")
+@with_appcontext
+def prune_revoked_tokens():
+    deleted = revocation_cache.prune()
+    print(f"Pruned {deleted} expired revoked tokens")
+
+
+def bulk_format(fmt, path):
+    if fmt:
+        return fmt
+    return "ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv"
+
+
+# csv needs files opened with newline=""; "-" is stdin / stdout
+def open_bulk_file(path, mode="r"):
+    if path == "-":
+        return contextlib.nullcontext(sys.stdin if mode == "r" else sys.stdout)
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+# flask import-products products.csv --user-id 1
+@click.command("import-products")
+@with_appcontext
+@click.argument("path", type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option("--user-id", type=int, required=True, help="Owner of the products")
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(FORMATS),
+    help="Default: from the file extension, else csv",
+)
+@click.option(
+    "--batch-size",
+    type=int,
+    help="Rows per COPY / INSERT (default: PRODUCTS_IMPORT_BATCH_SIZE)",
+)
+def import_products_command(path, user_id, fmt, batch_size):
+    if db.session.get(Users, user_id) is None:
+        raise click.ClickException(f"No user with id {user_id}")
+    fmt = bulk_format(fmt, path)
+    with open_bulk_file(path) as stream:
+        try:
+            count = import_products(
+                db.session.connection(),
+                Products.__table__,
+                read_products(stream, fmt),
+                user_id,
+                validate=product_fields_error,
+                batch_size=batch_size
+                or current_app.config["PRODUCTS_IMPORT_BATCH_SIZE"],
+            )
+        except BulkImportError as error:
+            db.session.rollback()
+            raise click.ClickException(f"{path}: {error}")
+    rebuild_product_stats(db.session.connection(), [user_id])
+    db.session.commit()
+    click.echo(f"Imported {count} products", err=True)
+
+
+# flask export-products products.csv [--user-id 1]; "-" writes to stdout
+@click.command("export-products")
+@with_appcontext
+@click.argument("path", default="-", type=click.Path(dir_okay=False, allow_dash=True))
+@click.option("--user-id", type=int, help="Only this user's products")
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(FORMATS),
+    help="Default: from the file extension, else csv",
+)
+def export_products_command(path, user_id, fmt):
+    fmt = bulk_format(fmt, path)
+    result = export_result(export_products_query(user_id))
+    with open_bulk_file(path, "w") as out:
+        for chunk in export_products(result, fmt, dumps=compact_dumps):
+            out.write(chunk)
+
+
+# Statements issued by the endpoints, checked by `flask check-query-plans`.
+# Full listings (/api/all-products without a cursor) read every row by
+# design and are left out.
+def endpoint_queries(dialect_name, user_id=1, product_id=1, after_id=1):
+    ids = list(range(product_id, product_id + 50))
+    return {
+        "login/register: user by email": Users.query.filter_by(
+            email="user1@example.com"
+        ).statement,
+        "auth: user lookup": db.select(Users).filter_by(id=user_id),
+        "auth: revocation refresh": revocation_cache.refresh_query(),
+        "auth: revocation full reload": revocation_cache.refresh_query(full=True),
+        "auth: revocation prune": revocation_cache.prune_query(),
+        "GET /api/products": user_products_query(user_id),
+        "GET /api/products/export": export_products_query(user_id),
+        "GET /api/all-products?after_id=": all_products_query(after_id).limit(
+            current_app.config["PRODUCTS_PAGE_MAX_LIMIT"]
+        ),
+        "PUT /api/products/<id>": db.update(Products)
+        .filter_by(id=product_id, user_id=user_id)
+        .values(name="name"),
+        "DELETE /api/products/<id>": db.delete(Products).filter_by(
+            id=product_id, user_id=user_id
+        ),
+        "PUT /api/products/batch": owned_product_prices_query(ids, user_id),
+        "stats: owner min/max recomputation": db.select(
+            db.func.min(Products.price)
+        ).where(Products.user_id == user_id),
+        "DELETE /api/products/batch": delete_owned_products_query(ids, user_id),
+        "GET /api/products/search?q=": search_products_query(
+            dialect_name, Products, Users, terms=["product", "12"]
+        ),
+        "GET /api/products/search?min_price=&max_price=": search_products_query(
+            dialect_name, Products, Users, min_price=10, max_price=20
+        ),
+        "GET /api/products/search?owner=": search_products_query(
+            dialect_name, Products, Users, owner="user1"
+        ),
+        "GET /api/products/search?cursor=": search_products_query(
+            dialect_name, Products, Users, after=(500.0, 1)
+        ),
+        "GET /api/products/changes?since=": changes_query(
+            dialect_name, user_id, after=(0, after_id)
+        ),
+        "GET /api/products/changes?scope=all&since=": changes_query(
+            dialect_name, after=(0, after_id)
+        ),
+    }
+
+
+# Fill an empty database with `users` users owning `products` products
+def seed_database(connection, users, products, chunk_size=10000):
+    if connection.execute(db.select(db.func.count()).select_from(Users)).scalar():
+        return False
+
+    for start in range(0, users, chunk_size):
+        connection.execute(
+            db.insert(Users),
+            [
+                {
+                    "name": f"user{i}",
+                    "email": f"user{i}@example.com",
+                    "gender": "x",
+                    "password": "not-a-hash",
+                }
+                for i in range(start + 1, min(start + chunk_size, users) + 1)
+            ],
+        )
+    for start in range(0, products, chunk_size):
+        connection.execute(
+            db.insert(Products),
+            [
+                {
+                    "name": f"product {i}",
+                    "description": f"description of product {i}",
+                    "price": (i * 7919) % 100000 / 100,
+                    "user_id": i % users + 1,
+                }
+                for i in range(start + 1, min(start + chunk_size, products) + 1)
+            ],
+        )
+    connection.execute(
+        db.insert(RevokedToken),
+        [{"jti": f"jti-{i}", "expires_at": datetime(2000, 1, 1)} for i in range(users)],
+    )
+    rebuild_product_stats(connection)
+    return True
+
+
+# Seed a scratch database and fail if any endpoint query would fall back to
+# a sequential scan
+@click.command("check-query-plans")
+@with_appcontext
+@click.option(
+    "--database-url",
+    help="Scratch database to seed and explain against "
+    "(default: a temporary SQLite file)",
+)
+@click.option("--users", default=1000, show_default=True)
+@click.option("--products", default=200000, show_default=True)
+def check_query_plans_command(database_url, users, products):
+    if not database_url:
+        database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "plans.db")
+    engine = db.create_engine(database_url)
+    db.metadata.create_all(engine)
+
+    with engine.begin() as connection:
+        if seed_database(connection, users, products):
+            print(f"Seeded {users} users and {products} products")
+        ensure_search_schema(connection)
+        ensure_change_feed_schema(connection)
+        if engine.dialect.name == "postgresql":
+            connection.exec_driver_sql("ANALYZE")
+
+    with engine.connect() as connection:
+        failures = check_query_plans(connection, endpoint_queries(engine.dialect.name))
+    engine.dispose()
+
+    for name, scans in failures.items():
+        print(f"FAIL {name}: {'; '.join(scans)}")
+    if failures:
+        raise click.ClickException(
+            f"{len(failures)} queries fall back to a sequential scan"
+        )
+    print("All endpoint queries use an index")
+
+
+# Recompute the product stats summary tables from the products table (after
+# changing stats.PRICE_BUCKETS, or writes that bypassed the API)
+@click.command("rebuild-product-stats")
+@with_appcontext
+@click.option("--user-id", type=int, multiple=True, help="Only these owners")
+def rebuild_product_stats_command(user_id):
+    rebuild_product_stats(db.session.connection(), list(user_id) or None)
+    db.session.commit()
+    print("Rebuilt product stats")
+
+
+# Delete the stored image files no product refers to anymore (replaced or
+# removed images, deleted products) and leftovers of failed uploads
+@click.command("prune-images")
+@with_appcontext
+@click.option(
+    "--min-age",
+    type=int,
+    default=3600,
+    show_default=True,
+    help="Keep files modified in the last SECONDS",
+)
+@click.option("--dry-run", is_flag=True, help="Only list the files")
+def prune_images(min_age, dry_run):
+    referenced = db.session.execute(
+        db.select(Products.img_path).where(Products.img_path.isnot(None)).distinct()
+    ).scalars()
+    count = 0
+    for path in unreferenced_images(
+        current_app.config["IMAGE_STORAGE_DIR"], set(referenced), min_age
+    ):
+        if dry_run:
+            print(path)
+        else:
+            os.remove(path)
+        count += 1
+    print(f"{'Found' if dry_run else 'Pruned'} {count} unreferenced image files")
+
+
+# Make the missing thumbnails of product images, e.g. after a restart lost
+# the queue of the background thumbnailer or after changing
+# IMAGE_THUMBNAIL_SIZE (remove the old thumbnails first)
+@click.command("make-thumbnails")
+@with_appcontext
+def make_thumbnails():
+    if Image is None:
+        raise click.ClickException("Thumbnails need Pillow (pip install Pillow)")
+    variants = current_app.extensions["image_variants"]
+    made = 0
+    for img_path in db.session.execute(
+        db.select(Products.img_path).where(Products.img_path.isnot(None)).distinct()
+    ).scalars():
+        try:
+            made += variants.make_thumbnail(img_path)
+        except Exception as error:
+            click.echo(f"{img_path}: {error}", err=True)
+    print(f"Made {made} thumbnails")
+
+
+# Delete the change log rows superseded by a later change of the same
+# product; the log then holds one row per product, deleted ones included
+@click.command("prune-product-changes")
+@with_appcontext
+def prune_product_changes():
+    deleted = db.session.execute(superseded_changes_query()).rowcount
+    db.session.commit()
+    print(f"Pruned {deleted} superseded product changes")
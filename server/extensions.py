@@ -0,0 +1,28 @@
+from flask import current_app
+from flask_cors import CORS
+from flask_sqlalchemy import SQLAlchemy
+from werkzeug.local import LocalProxy
+
+from replicas import RoutingSession
+from token_cache import CachingJWTManager
+
+# Flask extensions, bound to each app by create_app()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+jwt = CachingJWTManager()
+cors = CORS()
+
+
+# Per-app services are created by create_app() and stored in app.extensions,
+# so several apps (e.g. test instances) never share caches or pools. These
+# proxies resolve them on the current app.
+def _app_extension(name):
+    return LocalProxy(lambda: current_app.extensions[name])
+
+
+async_db = _app_extension("async_db")
+password_hasher = _app_extension("password_hasher")
+repository = _app_extension("repository")
+response_cache = _app_extension("response_cache")
+revocation_cache = _app_extension("revocation_cache")
+sql_instrumentation = _app_extension("sql_instrumentation")
+user_cache = _app_extension("user_cache")
@@ -0,0 +1,338 @@
+import os
+import tempfile
+import weakref
+
+from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+import auth
+import changes
+import images
+import monitoring
+import products
+import stats
+from admission import AdmissionController, LocalAdmissionState, SharedAdmissionState
+from async_db import AsyncDatabase
+from caching import ResponseCache, SharedGenerations, TTLCache
+from db_config import database_uri, engine_options
+from extensions import cors, db, jwt
+from group_commit import GroupCommitter
+from hashing import PasswordHasher
+from images import ImageVariants
+from instrumentation import SQLInstrumentation
+from models import RevokedToken
+from replicas import REPLICA_BIND, ReplicaRouter
+from repository import InMemoryRepository
+from revocation import RevocationCache
+from serializers import FastJSONProvider
+from sql_repository import (
+    DATABASE_ONLY_BLUEPRINTS,
+    DATABASE_ONLY_ENDPOINTS,
+    SQLAlchemyRepository,
+    database_required,
+)
+
+# Apps whose connections and worker pools are reset in forked children
+_apps = weakref.WeakSet()
+
+
+# File shared by the worker processes of the host, on tmpfs when there is one
+def _shared_memory_path(name):
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, name)
+
+
+# Configuration read from the environment, overridden by create_app(config)
+def default_config(env=os.environ):
+    config = {}
+    # Change this in production
+    config["JWT_SECRET_KEY"] = env.get("JWT_SECRET_KEY", "super-secret")
+    config["SQLALCHEMY_DATABASE_URI"] = database_uri(env)
+    # Storage of users, products and revoked tokens, see repository.py:
+    # "sqlalchemy", or "memory" to keep them in each worker process, for test
+    # suites and benchmarks of the auth and single-product endpoints. Those
+    # then run without a database; the others answer 501.
+    config["REPOSITORY"] = env.get("REPOSITORY", "sqlalchemy")
+    # Read replica for the @read_replica views (e.g. a second Postgres or, to
+    # try it locally, a copy of the SQLite file); unset reads the primary.
+    # After writing, a user reads the primary for REPLICA_STICKY_SECONDS; a
+    # failing replica is skipped for REPLICA_RETRY_SECONDS.
+    config["REPLICA_DATABASE_URI"] = env.get("REPLICA_DATABASE_URL")
+    config["REPLICA_STICKY_SECONDS"] = float(env.get("REPLICA_STICKY_SECONDS", 5))
+    config["REPLICA_RETRY_SECONDS"] = float(env.get("REPLICA_RETRY_SECONDS", 30))
+    # Serve GET /api/products and /api/all-products from async views backed by
+    # SQLAlchemy's asyncio extension (aiosqlite / asyncpg)
+    config["ASYNC_READS"] = env.get("ASYNC_READS", "").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # Set the token expiration time to 1 hour (3600 seconds)
+    config["JWT_ACCESS_TOKEN_EXPIRES"] = 3600
+    # Tokens only carry the user id as `sub` next to the standard claims; nbf
+    # would always equal iat
+    config["JWT_ENCODE_NBF"] = False
+    # Verified tokens whose claims are cached per worker, see token_cache
+    config["JWT_DECODE_CACHE_SIZE"] = 10000
+    # How stale the in-process revoked token list may get, and how often expired
+    # rows are deleted from the revoked_token table
+    config["REVOCATION_REFRESH_SECONDS"] = 5
+    config["REVOCATION_PRUNE_SECONDS"] = 3600
+    # Largest page served by keyset pagination, and rows fetched per round trip
+    # when a listing is streamed
+    config["PRODUCTS_PAGE_MAX_LIMIT"] = 1000
+    config["PRODUCTS_STREAM_CHUNK_SIZE"] = 500
+    # Users resolved from the token "sub" claim are cached per worker
+    config["USER_CACHE_TTL_SECONDS"] = 60
+    config["USER_CACHE_MAX_SIZE"] = 10000
+    # Password hashing runs in a process pool (0 workers hashes inline). When
+    # more than PASSWORD_HASH_MAX_PENDING hashes are queued, login and register
+    # answer 503. Hashes made with another method are upgraded on login.
+    config["PASSWORD_HASH_METHOD"] = "scrypt"
+    config["PASSWORD_HASH_WORKERS"] = int(env.get("PASSWORD_HASH_WORKERS", 2))
+    config["PASSWORD_HASH_MAX_PENDING"] = 8
+    config["PASSWORD_HASH_TIMEOUT_SECONDS"] = 10
+    # Most items accepted by one /api/products/batch request
+    config["PRODUCTS_BATCH_MAX_SIZE"] = 1000
+    # Rows written per COPY / INSERT by product imports
+    config["PRODUCTS_IMPORT_BATCH_SIZE"] = 5000
+    # Rendered product listings are cached per worker and invalidated by the
+    # product write handlers. Invalidations reach the other workers of the
+    # host through the generation counters in RESPONSE_CACHE_SHARED_PATH
+    # (empty: this process only); the TTL bounds staleness across hosts.
+    # Each keyset page is its own entry, so the cache is bounded by the total
+    # body size too, and bodies over RESPONSE_CACHE_MAX_ENTRY_BYTES (the
+    # unpaginated listings of a large catalog) aren't kept.
+    config["RESPONSE_CACHE_TTL_SECONDS"] = 30
+    config["RESPONSE_CACHE_MAX_SIZE"] = 10000
+    config["RESPONSE_CACHE_MAX_BYTES"] = int(
+        env.get("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+    )
+    config["RESPONSE_CACHE_MAX_ENTRY_BYTES"] = 1024 * 1024
+    config["RESPONSE_CACHE_SHARED_PATH"] = env.get(
+        "RESPONSE_CACHE_SHARED_PATH",
+        _shared_memory_path("products-api-response-cache"),
+    )
+    # Product images are stored under IMAGE_STORAGE_DIR (default: the app's
+    # instance folder), streamed in IMAGE_UPLOAD_CHUNK_SIZE chunks and limited
+    # to IMAGE_MAX_BYTES. Thumbnails fit in IMAGE_THUMBNAIL_SIZE (needs
+    # Pillow). Clients may cache served images for IMAGE_MAX_AGE_SECONDS,
+    # then revalidate them with their ETag.
+    config["IMAGE_STORAGE_DIR"] = env.get("IMAGE_STORAGE_DIR")
+    config["IMAGE_MAX_BYTES"] = int(env.get("IMAGE_MAX_BYTES", 10 * 1024 * 1024))
+    config["IMAGE_UPLOAD_CHUNK_SIZE"] = 64 * 1024
+    config["IMAGE_THUMBNAIL_SIZE"] = (256, 256)
+    config["IMAGE_MAX_AGE_SECONDS"] = 300
+    # Opt-in group commit of product creations and logouts: rows queued by
+    # concurrent requests are committed together once the oldest has waited
+    # WRITE_COALESCING_MAX_DELAY_MS or WRITE_COALESCING_MAX_ROWS are queued,
+    # see group_commit.GroupCommitter. A request waiting longer than
+    # WRITE_COALESCING_TIMEOUT_SECONDS for its commit is answered with 503.
+    config["WRITE_COALESCING"] = env.get("WRITE_COALESCING", "").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    config["WRITE_COALESCING_MAX_DELAY_MS"] = float(
+        env.get("WRITE_COALESCING_MAX_DELAY_MS", 5)
+    )
+    config["WRITE_COALESCING_MAX_ROWS"] = int(env.get("WRITE_COALESCING_MAX_ROWS", 500))
+    config["WRITE_COALESCING_TIMEOUT_SECONDS"] = float(
+        env.get("WRITE_COALESCING_TIMEOUT_SECONDS", 5)
+    )
+    # Requests running more SQL statements than this are logged as a likely N+1
+    # (and fail when app.testing), see instrumentation.SQLInstrumentation
+    config["SQL_QUERY_THRESHOLD"] = int(env.get("SQL_QUERY_THRESHOLD", 20))
+    # Admission control, see admission.AdmissionController. ADMISSION_LIMITS
+    # maps each route group to (concurrent requests, queued requests). Queued
+    # requests hold a worker thread while they wait (up to
+    # ADMISSION_QUEUE_TIMEOUT_SECONDS, then 503), so by default no group
+    # takes more than 3/4 of the WORKER_THREADS and a saturated group can't
+    # starve the others. The "local" backend counts per worker process,
+    # "shared" across the workers of a server through ADMISSION_SHARED_PATH
+    # (the limits are then server-wide: scale them by the worker count).
+    config["ADMISSION_CONTROL"] = env.get("ADMISSION_CONTROL", "1").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    config["ADMISSION_BACKEND"] = env.get("ADMISSION_BACKEND", "local")
+    config["ADMISSION_SHARED_PATH"] = env.get(
+        "ADMISSION_SHARED_PATH", _shared_memory_path("products-api-admission")
+    )
+    threads = int(env.get("WORKER_THREADS", 8))
+    queue_size = max(1, threads // 4)
+    config["ADMISSION_LIMITS"] = {
+        "auth": (max(1, threads // 4), queue_size),
+        "writes": (max(1, threads // 2), queue_size),
+        "listings": (max(1, threads // 2), queue_size),
+    }
+    config["ADMISSION_QUEUE_TIMEOUT_SECONDS"] = 1.0
+    config["ADMISSION_RETRY_AFTER_SECONDS"] = 1
+    # Token buckets per client address: (tokens per second, burst)
+    config["RATE_LIMITS"] = {
+        "login": (1.0, 10),
+        "register": (0.2, 5),
+    }
+    # Number of reverse proxies in front of the app. When set, the client
+    # address (which the rate limits are keyed on) is taken from that many
+    # X-Forwarded-For entries, see werkzeug's ProxyFix. Behind a proxy and
+    # left at 0, every client shares the proxy's address and its buckets; set
+    # without a proxy, clients can pick their own address.
+    config["TRUSTED_PROXIES"] = int(env.get("TRUSTED_PROXIES", 0))
+    return config
+
+
+# Build the API app. Nothing connects to the database or starts a thread or
+# process here: engines, the async loop and the hashing pool are used lazily,
+# and are reset in forked children, so the app can be preloaded by a
+# pre-fork server. CLI-only pieces (Flask-Migrate, Alembic, the maintenance
+# commands) are added by commands.init_cli().
+def create_app(config=None):
+    app = Flask(__name__)
+    # orjson-backed jsonify, see serializers.FastJSONProvider
+    app.json = FastJSONProvider(app)
+    app.config.update(default_config())
+    if config:
+        app.config.update(config)
+    if app.config["TRUSTED_PROXIES"]:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["TRUSTED_PROXIES"])
+    # Pool sizing, pre-ping, recycle and timeouts, see db_config.engine_options
+    app.config.setdefault(
+        "SQLALCHEMY_ENGINE_OPTIONS",
+        engine_options(app.config["SQLALCHEMY_DATABASE_URI"]),
+    )
+    if not app.config["IMAGE_STORAGE_DIR"]:
+        app.config["IMAGE_STORAGE_DIR"] = os.path.join(app.instance_path, "images")
+    replica_uri = app.config["REPLICA_DATABASE_URI"]
+    if replica_uri:
+        app.config.setdefault("SQLALCHEMY_BINDS", {})[REPLICA_BIND] = dict(
+            engine_options(replica_uri), url=replica_uri
+        )
+
+    db.init_app(app)
+    jwt.init_app(app)
+    cors.init_app(app)
+
+    app.extensions["password_hasher"] = PasswordHasher(
+        method=app.config["PASSWORD_HASH_METHOD"],
+        workers=app.config["PASSWORD_HASH_WORKERS"],
+        max_pending=app.config["PASSWORD_HASH_MAX_PENDING"],
+        timeout=app.config["PASSWORD_HASH_TIMEOUT_SECONDS"],
+    )
+    app.extensions["revocation_cache"] = RevocationCache(
+        db,
+        RevokedToken,
+        refresh_interval=app.config["REVOCATION_REFRESH_SECONDS"],
+        prune_interval=app.config["REVOCATION_PRUNE_SECONDS"],
+    )
+    if app.config["REPOSITORY"] == "memory":
+        app.extensions["repository"] = InMemoryRepository()
+    else:
+        app.extensions["repository"] = SQLAlchemyRepository()
+    app.extensions["user_cache"] = TTLCache(
+        maxsize=app.config["USER_CACHE_MAX_SIZE"],
+        ttl=app.config["USER_CACHE_TTL_SECONDS"],
+    )
+    shared_path = app.config["RESPONSE_CACHE_SHARED_PATH"]
+    app.extensions["response_cache"] = ResponseCache(
+        maxsize=app.config["RESPONSE_CACHE_MAX_SIZE"],
+        ttl=app.config["RESPONSE_CACHE_TTL_SECONDS"],
+        generations=SharedGenerations(shared_path) if shared_path else None,
+        max_bytes=app.config["RESPONSE_CACHE_MAX_BYTES"],
+        max_entry_bytes=app.config["RESPONSE_CACHE_MAX_ENTRY_BYTES"],
+    )
+    app.extensions["image_variants"] = ImageVariants(
+        app.config["IMAGE_STORAGE_DIR"],
+        size=app.config["IMAGE_THUMBNAIL_SIZE"],
+        logger=app.logger,
+    )
+    # Per-request query counts and DB time (Server-Timing header, /metrics)
+    instrumentation = SQLInstrumentation(
+        app, query_threshold=app.config["SQL_QUERY_THRESHOLD"]
+    )
+    with app.app_context():
+        for engine in db.engines.values():
+            instrumentation.instrument(engine)
+    app.extensions["sql_instrumentation"] = instrumentation
+    app.extensions["async_db"] = AsyncDatabase(
+        app.config["SQLALCHEMY_DATABASE_URI"], instrument=instrumentation.instrument
+    )
+    if app.config["WRITE_COALESCING"]:
+        with app.app_context():
+            app.extensions["group_commit"] = GroupCommitter(
+                db.engine,
+                max_delay=app.config["WRITE_COALESCING_MAX_DELAY_MS"] / 1000,
+                max_rows=app.config["WRITE_COALESCING_MAX_ROWS"],
+                timeout=app.config["WRITE_COALESCING_TIMEOUT_SECONDS"],
+                app=app,
+            )
+    if app.config["ADMISSION_CONTROL"]:
+        limits = app.config["ADMISSION_LIMITS"]
+        if app.config["ADMISSION_BACKEND"] == "shared":
+            state = SharedAdmissionState(app.config["ADMISSION_SHARED_PATH"], limits)
+        else:
+            state = LocalAdmissionState(limits)
+        app.extensions["admission"] = AdmissionController(
+            state,
+            queue_timeout=app.config["ADMISSION_QUEUE_TIMEOUT_SECONDS"],
+            retry_after=app.config["ADMISSION_RETRY_AFTER_SECONDS"],
+            rate_limits=app.config["RATE_LIMITS"],
+            app=app,
+        )
+    if replica_uri:
+        app.extensions["replica_router"] = ReplicaRouter(
+            app,
+            sticky_seconds=app.config["REPLICA_STICKY_SECONDS"],
+            retry_seconds=app.config["REPLICA_RETRY_SECONDS"],
+        )
+
+    app.register_blueprint(auth.bp)
+    app.register_blueprint(products.bp)
+    app.register_blueprint(stats.bp)
+    app.register_blueprint(images.bp)
+    app.register_blueprint(changes.bp)
+    app.register_blueprint(monitoring.bp)
+
+    if app.config["REPOSITORY"] == "memory":
+        for endpoint in list(app.view_functions):
+            if (
+                endpoint in DATABASE_ONLY_ENDPOINTS
+                or endpoint.split(".")[0] in DATABASE_ONLY_BLUEPRINTS
+            ):
+                app.view_functions[endpoint] = database_required
+    elif app.config["ASYNC_READS"]:
+        app.view_functions[
+            "products.get_user_products"
+        ] = products.get_user_products_async
+        app.view_functions[
+            "products.get_all_products_with_owners"
+        ] = products.get_all_products_with_owners_async
+
+    _apps.add(app)
+    return app
+
+
+# Pooled connections, the async loop, group commit and thumbnail threads,
+# the hashing processes, the in-memory repository lock, the response cache
+# generations and the admission state of the parent must not be shared with
+# forked workers: drop them (without closing the parent's connections) so
+# each child opens its own on first use
+def _reset_after_fork():
+    for app in list(_apps):
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+        app.extensions["async_db"].reset_after_fork()
+        app.extensions["password_hasher"].reset_after_fork()
+        app.extensions["image_variants"].reset_after_fork()
+        app.extensions["repository"].reset_after_fork()
+        app.extensions["response_cache"].generations.reset_after_fork()
+        if "group_commit" in app.extensions:
+            app.extensions["group_commit"].reset_after_fork()
+        if "admission" in app.extensions:
+            app.extensions["admission"].state.reset_after_fork()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
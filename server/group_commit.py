@@ -0,0 +1,191 @@
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from flask import current_app
+from sqlalchemy import insert
+
+from admission import busy_response
+from background import LazyThread
+from extensions import db
+from instrumentation import DURATION_BUCKETS_SECONDS, Histogram
+
+BATCH_ROWS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+# Raised when a row wasn't committed within the GroupCommitter's `timeout`;
+# answered with 503 and Retry-After
+class GroupCommitTimeout(Exception):
+    def __init__(self, table, retry_after):
+        super().__init__(f"insert into {table} timed out")
+        self.table = table
+        self.retry_after = retry_after
+
+
+# Coalesces single-row INSERTs from concurrent requests into shared
+# transactions (group commit), so N requests pay for one commit (and fsync)
+# instead of N.
+#
+# insert() queues a row and blocks until the transaction holding it has
+# committed, or raises its error: a request still only answers once its row
+# is durable. A background thread commits what is queued once the oldest row
+# has waited `max_delay` seconds or `max_rows` rows are queued. If a batch
+# fails, its rows are retried one transaction each, so one bad row only
+# fails its own request. A row's `hook(connection, rows)` (e.g. summary table
+# maintenance) runs in the same transaction, once for all its batch's rows.
+#
+# The thread is a LazyThread, (re)started by insert(). A request waits at most
+# `timeout` seconds: past that insert() raises GroupCommitTimeout, and the
+# row is dropped if its batch hasn't started yet (once it has, the row may
+# still be committed).
+class GroupCommitter:
+    def __init__(self, engine, max_delay=0.005, max_rows=500, timeout=5.0,
+                 retry_after=1, app=None):
+        self.engine = engine
+        self.max_delay = max_delay
+        self.max_rows = max_rows
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.batch_rows = Histogram(
+            "group_commit_batch_rows",
+            "Rows of a table committed per group-commit transaction.",
+            BATCH_ROWS_BUCKETS,
+        )
+        self.wait_duration = Histogram(
+            "group_commit_wait_seconds",
+            "Time a row waited for its batch to start (latency added by coalescing).",
+            DURATION_BUCKETS_SECONDS,
+        )
+        self.commit_duration = Histogram(
+            "group_commit_commit_seconds",
+            "Time spent writing and committing one batch holding rows of the table.",
+            DURATION_BUCKETS_SECONDS,
+        )
+        self.reset_after_fork()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.register_error_handler(GroupCommitTimeout, group_commit_timeout_response)
+
+    # The flusher thread doesn't survive a fork, the child starts its own
+    def reset_after_fork(self):
+        self._pending = []  # (table, values, hook, future, queued at)
+        self._condition = threading.Condition()
+        self._thread = LazyThread(self._run, "group-commit")
+
+    # Insert `values` into `table` and return its id once it is committed
+    def insert(self, table, values, hook=None):
+        self._thread.start()
+        future = Future()
+        with self._condition:
+            self._pending.append(
+                (table, values, hook, future, time.perf_counter())
+            )
+            if len(self._pending) == 1 or len(self._pending) >= self.max_rows:
+                self._condition.notify()
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise GroupCommitTimeout(table.name, self.retry_after) from None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                deadline = self._pending[0][4] + self.max_delay
+                while len(self._pending) < self.max_rows:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = self._pending[: self.max_rows]
+                del self._pending[: self.max_rows]
+            # rows whose request timed out meanwhile are cancelled, the
+            # others can't be anymore
+            batch = [item for item in batch if item[3].set_running_or_notify_cancel()]
+            try:
+                self._commit(batch)
+            except Exception as error:
+                # a bug here must fail the batch's requests, not the thread
+                for item in batch:
+                    if not item[3].done():
+                        item[3].set_exception(error)
+
+    def _commit(self, batch):
+        if not batch:
+            return
+        started = time.perf_counter()
+        rows = defaultdict(list)
+        hooks = defaultdict(list)
+        for table, values, hook, future, queued_at in batch:
+            rows[table].append(values)
+            if hook is not None:
+                hooks[hook].append(values)
+        try:
+            with self.engine.begin() as connection:
+                # one multi-row INSERT ... RETURNING per table, ids in row order
+                ids = {
+                    table: iter(
+                        connection.execute(
+                            insert(table).returning(
+                                table.c.id, sort_by_parameter_order=True
+                            ),
+                            table_rows,
+                        ).scalars().all()
+                    )
+                    for table, table_rows in rows.items()
+                }
+                for hook, hook_rows in hooks.items():
+                    hook(connection, hook_rows)
+        except Exception as error:
+            # any failure is handed to the waiting requests, never lost
+            if len(batch) == 1:
+                batch[0][3].set_exception(error)
+                return
+            for item in batch:
+                self._commit([item])
+            return
+
+        finished = time.perf_counter()
+        for table, table_rows in rows.items():
+            self.batch_rows.observe((table.name,), len(table_rows))
+            self.commit_duration.observe((table.name,), finished - started)
+        for table, values, hook, future, queued_at in batch:
+            self.wait_duration.observe((table.name,), started - queued_at)
+            future.set_result(next(ids[table]))
+
+    # Prometheus text exposition of the batch size and latency histograms
+    def render_metrics(self):
+        lines = (
+            self.batch_rows.render(("table",))
+            + self.commit_duration.render(("table",))
+            + self.wait_duration.render(("table",))
+        )
+        return "\n".join(lines) + "\n"
+
+
+def group_commit_timeout_response(error):
+    return busy_response(error.retry_after)
+
+
+# Insert one row of `model`, commit it and return its id: through the app's
+# GroupCommitter when WRITE_COALESCING is on, else in the request's own
+# session. `hook` is called as hook(connection, [values]) in the same
+# transaction.
+def insert_committed(model, values, hook=None):
+    committer = current_app.extensions.get("group_commit")
+    if committer is not None:
+        return committer.insert(model.__table__, values, hook)
+    row = model(**values)
+    db.session.add(row)
+    db.session.flush()
+    if hook is not None:
+        hook(db.session.connection(), [values])
+    row_id = row.id
+    db.session.commit()
+    return row_id
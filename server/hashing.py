@@ -0,0 +1,96 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import cached_property
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+# Raised when the hashing queue is full (or a job timed out); handlers turn it
+# into a fast 503 instead of tying up a worker thread
+class HashingPoolBusy(Exception):
+    pass
+
+
+def _hash_method(pwhash):
+    return pwhash.split("$", 1)[0]
+
+
+# Run in the pool processes
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _verify(pwhash, password, method, target_method):
+    if not check_password_hash(pwhash, password):
+        return False, None
+    # Transparently upgrade hashes made with another method or cost
+    if _hash_method(pwhash) != target_method:
+        return True, generate_password_hash(password, method=method)
+    return True, None
+
+
+# Password hashing off the request thread.
+#
+# Hashes are computed in a process pool so a burst of logins can't starve the
+# interpreter serving the other endpoints. At most `max_pending` jobs may be
+# queued or running; past that `HashingPoolBusy` is raised immediately. With
+# `workers=0` hashing runs inline on the calling thread.
+class PasswordHasher:
+    def __init__(self, method="scrypt", workers=2, max_pending=8, timeout=10.0):
+        self.method = method
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.reset_after_fork()
+
+    # Full method string as stored in hashes, e.g. "scrypt:32768:8:1"
+    @cached_property
+    def target_method(self):
+        return _hash_method(generate_password_hash("", method=self.method))
+
+    def hash(self, password):
+        return self._run(_hash, password, self.method)
+
+    # Returns (matches, new_hash); new_hash is set when the stored hash should
+    # be replaced because it was made with a different method or cost
+    def verify(self, pwhash, password):
+        return self._run(_verify, pwhash, password, self.method, self.target_method)
+
+    # A forked child can't use the parent's pool or locks, it starts its own
+    def reset_after_fork(self):
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+    def _get_executor(self):
+        # Created on first use, so forking servers start the pool per worker
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+
+        if not self._slots.acquire(blocking=False):
+            raise HashingPoolBusy()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise HashingPoolBusy()
@@ -0,0 +1,308 @@
+import hashlib
+import os
+import queue
+import tempfile
+import time
+
+from flask import Blueprint, current_app, jsonify, request, send_file
+from flask_jwt_extended import get_current_user, jwt_required
+
+from admission import admit
+from background import LazyThread
+from extensions import db
+from models import Products
+from products import invalidate_product_listings
+from replicas import read_replica
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - thumbnails are skipped without Pillow
+    Image = None
+
+# Accepted formats by their leading bytes (the Content-Type sent by the
+# client is not trusted): magic bytes, offset, file extension
+SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", 0, "png"),
+    (b"\xff\xd8\xff", 0, "jpg"),
+    (b"GIF87a", 0, "gif"),
+    (b"GIF89a", 0, "gif"),
+    (b"WEBP", 8, "webp"),
+)
+SIGNATURE_BYTES = 12
+# Pillow format of each extension; GIF thumbnails are written as PNG
+THUMBNAIL_FORMATS = {"png": "PNG", "jpg": "JPEG", "gif": "PNG", "webp": "WEBP"}
+
+# Product images, uploaded as the raw request body and stored by content:
+# a file is named after its SHA-256 (IMAGE_STORAGE_DIR/ab/abcd....png), so
+# the same image uploaded for several products is stored once and
+# Products.img_path holds the path relative to the storage directory.
+# Replacing or removing an image leaves the file for `flask prune-images`.
+bp = Blueprint("images", __name__)
+
+
+class ImageUploadError(Exception):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def image_extension(head):
+    for magic, offset, extension in SIGNATURES:
+        if head[offset : offset + len(magic)] == magic:
+            return extension
+    return None
+
+
+def thumbnail_path(img_path):
+    root, extension = os.path.splitext(img_path)
+    if extension == ".gif":
+        extension = ".png"
+    return f"{root}.thumb{extension}"
+
+
+# Stream `stream` into the store under `directory`, `chunk_size` bytes at a
+# time so worker memory stays flat whatever the file size, hashing it on the
+# way. The upload is written to a temporary file in the store and renamed
+# once complete, so readers never see partial files. Returns (img_path,
+# sha256 hex digest, size, whether the file was already stored).
+def store_image(stream, directory, max_bytes, chunk_size):
+    tmp_directory = os.path.join(directory, "tmp")
+    os.makedirs(tmp_directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_directory)
+    try:
+        digest = hashlib.sha256()
+        head = b""
+        size = 0
+        with os.fdopen(fd, "wb") as file:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ImageUploadError(
+                        f"Images are limited to {max_bytes} bytes", 413
+                    )
+                if len(head) < SIGNATURE_BYTES:
+                    head += chunk[: SIGNATURE_BYTES - len(head)]
+                digest.update(chunk)
+                file.write(chunk)
+            file.flush()
+            os.fsync(file.fileno())
+
+        if not size:
+            raise ImageUploadError("The request body is empty", 400)
+        extension = image_extension(head)
+        if extension is None:
+            raise ImageUploadError("Images must be PNG, JPEG, GIF or WebP", 415)
+
+        hexdigest = digest.hexdigest()
+        img_path = f"{hexdigest[:2]}/{hexdigest}.{extension}"
+        path = os.path.join(directory, img_path)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            # recently modified files are left alone by `flask prune-images`
+            os.utime(path)
+            return img_path, hexdigest, size, True
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return img_path, hexdigest, size, False
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# Makes the thumbnails of uploaded images on a background thread, off the
+# request path, with Pillow (without it, the original is served instead).
+# Thumbnails are derived from the stored files only, so a lost queue (a
+# restart) just means the original is served until the image is uploaded
+# again or `flask make-thumbnails` runs. The thread is a LazyThread, started
+# by submit().
+class ImageVariants:
+    def __init__(self, directory, size, logger):
+        self.directory = directory
+        self.size = size
+        self.logger = logger
+        self.reset_after_fork()
+
+    def reset_after_fork(self):
+        self._queue = queue.Queue()
+        self._thread = LazyThread(self._run, "image-variants")
+
+    def submit(self, img_path):
+        if Image is None:
+            return
+        self._thread.start()
+        self._queue.put(img_path)
+
+    def _run(self):
+        while True:
+            img_path = self._queue.get()
+            try:
+                self.make_thumbnail(img_path)
+            except OSError as error:
+                # includes files Pillow can't decode despite their signature
+                self.logger.warning("Thumbnail of %s failed: %s", img_path, error)
+            except Exception:
+                self.logger.exception("Thumbnail of %s failed", img_path)
+
+    # Write the thumbnail of `img_path` unless it exists; returns whether it
+    # was written
+    def make_thumbnail(self, img_path):
+        target = os.path.join(self.directory, thumbnail_path(img_path))
+        if os.path.exists(target):
+            return False
+        with Image.open(os.path.join(self.directory, img_path)) as image:
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail(self.size)
+            if image.mode not in ("RGB", "RGBA", "L", "LA"):
+                image = image.convert("RGBA")
+            extension = os.path.splitext(target)[1][1:]
+            if extension == "jpg" and image.mode != "RGB":
+                image = image.convert("RGB")
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.directory, "tmp"))
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    image.save(file, format=THUMBNAIL_FORMATS[extension])
+                os.replace(tmp_path, target)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        return True
+
+
+# Stored files (originals and thumbnails) no product refers to anymore, and
+# leftover temporary files. Files modified in the last `min_age` seconds are
+# skipped: they may belong to an upload that isn't committed yet.
+def unreferenced_images(directory, referenced, min_age=3600):
+    digests = {os.path.basename(img_path).split(".")[0] for img_path in referenced}
+    for root, dirs, files in os.walk(directory):
+        in_tmp = os.path.basename(root) == "tmp"
+        for name in files:
+            path = os.path.join(root, name)
+            if time.time() - os.path.getmtime(path) < min_age:
+                continue
+            if in_tmp or name.split(".")[0] not in digests:
+                yield path
+
+
+def owned_product(product_id, user_id):
+    return Products.query.filter_by(id=product_id, user_id=user_id)
+
+
+# Upload the image of a product as the request body (not multipart), up to
+# IMAGE_MAX_BYTES, replacing the current one
+@bp.route("/api/products/<int:product_id>/image", methods=["PUT"])
+@admit("writes")
+@jwt_required()
+def upload_product_image(product_id):
+    current_user = get_current_user()
+    config = current_app.config
+
+    product = owned_product(product_id, current_user["id"])
+    if not db.session.query(product.exists()).scalar():
+        return (
+            jsonify({"message": "Product not found or does not belong to the user"}),
+            404,
+        )
+    # don't hold a pooled connection while the body is coming in
+    db.session.rollback()
+
+    if request.content_length and request.content_length > config["IMAGE_MAX_BYTES"]:
+        message = f"Images are limited to {config['IMAGE_MAX_BYTES']} bytes"
+        return jsonify({"message": message}), 413
+    try:
+        img_path, hexdigest, size, deduplicated = store_image(
+            request.stream,
+            config["IMAGE_STORAGE_DIR"],
+            config["IMAGE_MAX_BYTES"],
+            config["IMAGE_UPLOAD_CHUNK_SIZE"],
+        )
+    except ImageUploadError as error:
+        return jsonify({"message": error.message}), error.status
+
+    if not product.update({"img_path": img_path}, synchronize_session=False):
+        return (
+            jsonify({"message": "Product not found or does not belong to the user"}),
+            404,
+        )
+    db.session.commit()
+    invalidate_product_listings(current_user["id"])
+    current_app.extensions["image_variants"].submit(img_path)
+    return (
+        jsonify(
+            {
+                "message": "Image uploaded successfully!",
+                "img_path": img_path,
+                "sha256": hexdigest,
+                "size": size,
+                "deduplicated": deduplicated,
+            }
+        ),
+        200,
+    )
+
+
+# Remove the image of a product (the file is left for `flask prune-images`)
+@bp.route("/api/products/<int:product_id>/image", methods=["DELETE"])
+@admit("writes")
+@jwt_required()
+def delete_product_image(product_id):
+    current_user = get_current_user()
+
+    found = (
+        owned_product(product_id, current_user["id"])
+        .filter(Products.img_path.isnot(None))
+        .update({"img_path": None}, synchronize_session=False)
+    )
+    if not found:
+        return jsonify({"message": "No image found for this product"}), 404
+    db.session.commit()
+    invalidate_product_listings(current_user["id"])
+    return jsonify({"message": "Image deleted successfully!"}), 200
+
+
+# Serve the image of a product, or its thumbnail with ?variant=thumbnail
+# (the original until the thumbnail is ready). send_file answers
+# If-None-Match / If-Modified-Since with 304 and Range requests with 206,
+# and hands the open file to the server's wsgi.file_wrapper, so the body is
+# sent (with sendfile where the server supports it) after the view has
+# returned and released its worker slot. With USE_X_SENDFILE the file is
+# sent by the front proxy instead.
+@bp.route("/api/products/<int:product_id>/image", methods=["GET"])
+@admit("listings")
+@read_replica
+@jwt_required()
+def get_product_image(product_id):
+    variant = request.args.get("variant", "original")
+    if variant not in ("original", "thumbnail"):
+        return jsonify({"message": "variant must be 'original' or 'thumbnail'"}), 400
+
+    img_path = db.session.execute(
+        db.select(Products.img_path).where(Products.id == product_id)
+    ).scalar()
+    if not img_path:
+        return jsonify({"message": "No image found for this product"}), 404
+
+    directory = current_app.config["IMAGE_STORAGE_DIR"]
+    path = os.path.join(directory, img_path)
+    if variant == "thumbnail":
+        thumbnail = os.path.join(directory, thumbnail_path(img_path))
+        if os.path.exists(thumbnail):
+            path = thumbnail
+    if not os.path.exists(path):
+        return jsonify({"message": "No image found for this product"}), 404
+
+    # file names are content hashes: a strong ETag for free
+    response = send_file(
+        path,
+        conditional=True,
+        etag=os.path.basename(path),
+        max_age=current_app.config["IMAGE_MAX_AGE_SECONDS"],
+    )
+    # behind authentication: not for shared caches
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
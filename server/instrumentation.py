@@ -0,0 +1,192 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+from flask import g, has_request_context, request, request_finished, request_started
+from sqlalchemy import event
+
+# Upper bounds of the histogram buckets exported on /metrics
+DURATION_BUCKETS_SECONDS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class TooManyQueries(Exception):
+    pass
+
+
+# Prometheus-style cumulative histogram, one series per label set
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [
+                    [0] * (len(self.buckets) + 1), 0.0, 0
+                ]
+            series[0][bucket] += 1
+            series[1] += value
+            series[2] += 1
+
+    # (sum, count) of the series for `labels`
+    def totals(self, labels):
+        with self._lock:
+            series = self._series.get(labels)
+            return (series[1], series[2]) if series else (0.0, 0)
+
+    def render(self, label_names):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(
+                (labels, list(counts), total, count)
+                for labels, (counts, total, count) in self._series.items()
+            )
+        for labels, counts, total, count in series:
+            pairs = [
+                f'{name}="{_escape(value)}"' for name, value in zip(label_names, labels)
+            ]
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = ",".join(pairs + [f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{{{le}}} {cumulative}")
+            label_set = "{" + ",".join(pairs) + "}" if pairs else ""
+            lines.append(f"{self.name}_sum{label_set} {total}")
+            lines.append(f"{self.name}_count{label_set} {count}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Skip SQLInstrumentation's query threshold for a view (place it above
+# @jwt_required() and the like, right under the route decorator)
+def query_threshold_exempt(view):
+    view.query_threshold_exempt = True
+    return view
+
+
+# Counts the SQL statements each request runs and the time spent in them.
+#
+# Every response gets a Server-Timing header (`db` with the query count and
+# time, `app` for the whole request), and per-route histograms are kept for
+# render_metrics(). A request running more than `query_threshold` statements
+# is logged as a warning, naming the statement it repeated most (the usual
+# N+1 pattern: a lazy relationship loaded once per row). With
+# `raise_on_threshold` (by default: when app.testing) it raises
+# TooManyQueries instead. Views that run many statements by design are
+# marked with @query_threshold_exempt.
+#
+# Statements are attributed to the request whose context runs them (the
+# async views' queries too, see async_db.AsyncDatabase.run()).
+class SQLInstrumentation:
+    def __init__(self, app=None, query_threshold=20, raise_on_threshold=None):
+        self.query_threshold = query_threshold
+        self.raise_on_threshold = raise_on_threshold
+        self.label_names = ("method", "route", "status")
+        self.request_duration = Histogram(
+            "http_request_duration_seconds",
+            "Time spent handling the request.",
+            DURATION_BUCKETS_SECONDS,
+        )
+        self.db_duration = Histogram(
+            "http_request_db_duration_seconds",
+            "Time spent executing SQL statements per request.",
+            DURATION_BUCKETS_SECONDS,
+        )
+        self.db_queries = Histogram(
+            "http_request_db_queries",
+            "SQL statements executed per request.",
+            QUERY_COUNT_BUCKETS,
+        )
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        request_started.connect(self._request_started, app, weak=False)
+        request_finished.connect(self._request_finished, app, weak=False)
+
+    def instrument(self, engine):
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    # Start times are kept on the connection: statements of an asyncio
+    # engine interleave on one thread
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context,
+                               executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context,
+                              executemany):
+        started = conn.info.get("query_started")
+        if not started:
+            return
+        started = started.pop()
+        if not has_request_context():
+            return
+        stats = g.get("_sql_stats")
+        if stats is None:
+            return
+        stats["time"] += time.perf_counter() - started
+        stats["statements"][statement] += 1
+
+    def _request_started(self, sender, **extra):
+        g._sql_stats = {
+            "started": time.perf_counter(),
+            "time": 0.0,
+            "statements": Counter(),
+        }
+
+    def _request_finished(self, sender, response, **extra):
+        stats = g.pop("_sql_stats", None)
+        if stats is None:
+            return
+        elapsed = time.perf_counter() - stats["started"]
+        queries = sum(stats["statements"].values())
+
+        response.headers.add(
+            "Server-Timing",
+            f'db;desc="{queries} queries";dur={stats["time"] * 1000:.2f}, '
+            f"app;dur={elapsed * 1000:.2f}",
+        )
+
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        labels = (request.method, route, str(response.status_code))
+        self.request_duration.observe(labels, elapsed)
+        self.db_duration.observe(labels, stats["time"])
+        self.db_queries.observe(labels, queries)
+
+        view = self.app.view_functions.get(request.endpoint)
+        exempt = getattr(view, "query_threshold_exempt", False)
+        if queries > self.query_threshold and not exempt:
+            statement, repeats = stats["statements"].most_common(1)[0]
+            message = (
+                f"{request.method} {request.path} ran {queries} SQL statements "
+                f"(threshold {self.query_threshold}); repeated {repeats} times: "
+                f"{statement}"
+            )
+            raise_on_threshold = self.raise_on_threshold
+            if raise_on_threshold is None:
+                raise_on_threshold = self.app.testing
+            if raise_on_threshold:
+                raise TooManyQueries(message)
+            self.app.logger.warning(message)
+
+    # Prometheus text exposition of the per-route histograms
+    def render_metrics(self):
+        lines = []
+        for histogram in (self.request_duration, self.db_duration, self.db_queries):
+            lines += histogram.render(self.label_names)
+        return "\n".join(lines) + "\n"
@@ -26,6 +26,23 @@ config.set_main_option(
         '%', '%%'))
 target_metadata = current_app.extensions['migrate'].db.metadata
 
+# Search objects created with raw SQL by the "product search" revision and
+# search.ensure_search_schema(), outside the models: the SQLite FTS5 table
+# (and its shadow tables products_fts_data, _idx, _docsize and _config) and
+# the Postgres generated column and its GIN index. Without this filter
+# autogenerate proposes dropping them.
+SEARCH_TABLE_PREFIX = 'products_fts'
+SEARCH_OBJECTS = {
+    ('column', 'search_vector'),
+    ('index', 'ix_products_search_vector'),
+}
+
+
+def include_name(name, type_, parent_names):
+    if type_ == 'table':
+        return not name.startswith(SEARCH_TABLE_PREFIX)
+    return (type_, name) not in SEARCH_OBJECTS
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -46,7 +63,10 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=target_metadata, literal_binds=True
+        url=url,
+        target_metadata=target_metadata,
+        include_name=include_name,
+        literal_binds=True,
     )
 
     with context.begin_transaction():
@@ -77,6 +97,7 @@ def run_migrations_online():
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
+            include_name=include_name,
             process_revision_directives=process_revision_directives,
             **current_app.extensions['migrate'].configure_args
         )
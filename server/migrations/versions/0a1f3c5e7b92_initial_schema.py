@@ -0,0 +1,58 @@
+"""initial schema
+
+Revision ID: 0a1f3c5e7b92
+Revises: 
+Create Date: 2026-10-17 08:30:02.816440
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a1f3c5e7b92'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# The tables as they were before the first revision. Databases created with
+# db.create_all() already have them, so only missing tables are created.
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'users' not in existing:
+        op.create_table(
+            'users',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(100), nullable=False),
+            sa.Column('email', sa.String(100), nullable=False),
+            sa.Column('gender', sa.String(10), nullable=False),
+            sa.Column('password', sa.String(255), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('name'),
+            sa.UniqueConstraint('email'),
+        )
+    if 'products' not in existing:
+        op.create_table(
+            'products',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(100), nullable=False),
+            sa.Column('description', sa.Text(), nullable=True),
+            sa.Column('price', sa.Float(), nullable=False),
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+    if 'revoked_token' not in existing:
+        op.create_table(
+            'revoked_token',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('jti', sa.String(120), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+
+def downgrade():
+    op.drop_table('revoked_token')
+    op.drop_table('products')
+    op.drop_table('users')
@@ -0,0 +1,47 @@
+"""revoked token expiry
+
+Revision ID: 1c4e9d2a7f35
+Revises: 0a1f3c5e7b92
+Create Date: 2026-10-17 08:47:19.305527
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1c4e9d2a7f35'
+down_revision = '0a1f3c5e7b92'
+branch_labels = None
+depends_on = None
+
+
+# Databases created with db.create_all() may already have some of these, so
+# only what is missing is added
+INDEXES = [
+    ('ix_revoked_token_jti', 'revoked_token', ['jti']),
+    ('ix_revoked_token_expires_at', 'revoked_token', ['expires_at']),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    existing = {c['name'] for c in inspector.get_columns('revoked_token')}
+    if 'expires_at' not in existing:
+        op.add_column(
+            'revoked_token', sa.Column('expires_at', sa.DateTime(), nullable=True)
+        )
+
+    existing = {i['name'] for i in inspector.get_indexes('revoked_token')}
+    for name, table, columns in INDEXES:
+        if name not in existing:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
+
+    with op.batch_alter_table('revoked_token') as batch_op:
+        batch_op.drop_column('expires_at')
@@ -0,0 +1,74 @@
+"""product stats summary tables
+
+Revision ID: 3f9c2a7d41b6
+Revises: edc33d5412a3
+Create Date: 2026-10-17 19:52:10.408215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a7d41b6'
+down_revision = 'edc33d5412a3'
+branch_labels = None
+depends_on = None
+
+# stats.PRICE_BUCKETS when this revision was written
+PRICE_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+# Databases created with db.create_all() already have the tables, kept up to
+# date by the app: they are only created and backfilled where missing or
+# empty.
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    if 'product_stats' not in existing:
+        op.create_table(
+            'product_stats',
+            sa.Column(
+                'user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False
+            ),
+            sa.Column('product_count', sa.Integer(), nullable=False),
+            sa.Column('price_sum', sa.Float(), nullable=False),
+            sa.Column('price_min', sa.Float(), nullable=True),
+            sa.Column('price_max', sa.Float(), nullable=True),
+            sa.PrimaryKeyConstraint('user_id'),
+        )
+    if 'product_price_buckets' not in existing:
+        op.create_table(
+            'product_price_buckets',
+            sa.Column(
+                'user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False
+            ),
+            sa.Column('bucket', sa.Integer(), nullable=False),
+            sa.Column('product_count', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('user_id', 'bucket'),
+        )
+
+    # Backfill from the existing products
+    bucket = ' '.join(
+        f'WHEN price <= {bound} THEN {index}'
+        for index, bound in enumerate(PRICE_BUCKETS)
+    )
+    bucket = f'CASE {bucket} ELSE {len(PRICE_BUCKETS)} END'
+    op.execute(
+        'INSERT INTO product_stats '
+        '(user_id, product_count, price_sum, price_min, price_max) '
+        'SELECT user_id, count(*), sum(price), min(price), max(price) '
+        'FROM products '
+        'WHERE NOT EXISTS (SELECT 1 FROM product_stats) '
+        'GROUP BY user_id'
+    )
+    op.execute(
+        'INSERT INTO product_price_buckets (user_id, bucket, product_count) '
+        f'SELECT user_id, {bucket}, count(*) FROM products '
+        'WHERE NOT EXISTS (SELECT 1 FROM product_price_buckets) '
+        f'GROUP BY user_id, {bucket}'
+    )
+
+
+def downgrade():
+    op.drop_table('product_price_buckets')
+    op.drop_table('product_stats')
@@ -0,0 +1,38 @@
+"""products owner index
+
+Revision ID: 7b7970bb43fa
+Revises: 1c4e9d2a7f35
+Create Date: 2026-10-17 09:12:41.502113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b7970bb43fa'
+down_revision = '1c4e9d2a7f35'
+branch_labels = None
+depends_on = None
+
+
+# Databases created with db.create_all() may already have some of these, so
+# only what is missing is added. The revoked_token column and indexes are
+# added by 1c4e9d2a7f35.
+INDEXES = [
+    ('ix_products_user_id_id', 'products', ['user_id', 'id']),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    for name, table, columns in INDEXES:
+        existing = {i['name'] for i in inspector.get_indexes(table)}
+        if name not in existing:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
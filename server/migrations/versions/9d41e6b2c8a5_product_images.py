@@ -0,0 +1,28 @@
+"""product images
+
+Revision ID: 9d41e6b2c8a5
+Revises: 3f9c2a7d41b6
+Create Date: 2026-10-17 20:41:27.614380
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d41e6b2c8a5'
+down_revision = '3f9c2a7d41b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('products')}
+    if 'img_path' not in existing:
+        op.add_column('products', sa.Column('img_path', sa.String(255), nullable=True))
+
+
+def downgrade():
+    # SQLite >= 3.35 drops columns in place; a batch (copy and rename) would
+    # lose the search triggers on products
+    op.execute('ALTER TABLE products DROP COLUMN img_path')
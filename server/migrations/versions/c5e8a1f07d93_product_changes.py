@@ -0,0 +1,122 @@
+"""product changes
+
+Revision ID: c5e8a1f07d93
+Revises: 9d41e6b2c8a5
+Create Date: 2026-10-17 21:18:52.207641
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e8a1f07d93'
+down_revision = '9d41e6b2c8a5'
+branch_labels = None
+depends_on = None
+
+# changes.SQLITE_CHANGE_FEED_SCHEMA / POSTGRESQL_CHANGE_FEED_SCHEMA when this
+# revision was written
+SQLITE_TRIGGERS = [
+    ('product_changes_insert', 'INSERT', 'new', 0),
+    ('product_changes_update', 'UPDATE', 'new', 0),
+    ('product_changes_delete', 'DELETE', 'old', 1),
+]
+POSTGRESQL_TRIGGERS = [
+    ('product_changes_insert', 'INSERT', 'NEW TABLE AS new_rows'),
+    ('product_changes_update', 'UPDATE', 'NEW TABLE AS new_rows'),
+    ('product_changes_delete', 'DELETE', 'OLD TABLE AS old_rows'),
+]
+INDEXES = [
+    ('ix_product_changes_txid_seq', ['txid', 'seq']),
+    ('ix_product_changes_user_id_txid_seq', ['user_id', 'txid', 'seq']),
+    ('ix_product_changes_product_id_seq', ['product_id', 'seq']),
+]
+
+
+# Databases created with db.create_all() may already have the table, its
+# indexes and (through changes.ensure_change_feed_schema()) the triggers and
+# rows, so only what is missing is added.
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if 'product_changes' not in inspector.get_table_names():
+        op.create_table(
+            'product_changes',
+            sa.Column(
+                'seq',
+                sa.BigInteger().with_variant(sa.Integer(), 'sqlite'),
+                nullable=False,
+            ),
+            sa.Column('txid', sa.BigInteger(), server_default='0', nullable=False),
+            sa.Column('product_id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column(
+                'deleted', sa.Boolean(), server_default=sa.false(), nullable=False
+            ),
+            sa.Column(
+                'changed_at',
+                sa.DateTime(),
+                server_default=sa.func.current_timestamp(),
+                nullable=False,
+            ),
+            sa.PrimaryKeyConstraint('seq'),
+            sqlite_autoincrement=True,
+        )
+        existing = set()
+    else:
+        existing = {i['name'] for i in inspector.get_indexes('product_changes')}
+    for name, columns in INDEXES:
+        if name not in existing:
+            op.create_index(name, 'product_changes', columns)
+
+    if bind.dialect.name == 'sqlite':
+        for name, event, row, deleted in SQLITE_TRIGGERS:
+            op.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON products '
+                'BEGIN INSERT INTO product_changes (product_id, user_id, deleted) '
+                f'VALUES ({row}.id, {row}.user_id, {deleted}); END'
+            )
+    elif bind.dialect.name == 'postgresql':
+        op.execute(
+            'CREATE OR REPLACE FUNCTION record_product_changes() '
+            'RETURNS trigger AS $$ BEGIN '
+            "IF TG_OP = 'DELETE' THEN "
+            'INSERT INTO product_changes (txid, product_id, user_id, deleted) '
+            'SELECT txid_current(), id, user_id, true FROM old_rows ORDER BY id; '
+            'ELSE '
+            'INSERT INTO product_changes (txid, product_id, user_id, deleted) '
+            'SELECT txid_current(), id, user_id, false FROM new_rows ORDER BY id; '
+            'END IF; RETURN NULL; END $$ LANGUAGE plpgsql'
+        )
+        for name, event, transition in POSTGRESQL_TRIGGERS:
+            op.execute(f'DROP TRIGGER IF EXISTS {name} ON products')
+            op.execute(
+                f'CREATE TRIGGER {name} AFTER {event} ON products '
+                f'REFERENCING {transition} '
+                'FOR EACH STATEMENT EXECUTE FUNCTION record_product_changes()'
+            )
+
+    # The existing products, as if they had just been written, unless the
+    # feed already has rows
+    op.execute(
+        'INSERT INTO product_changes (product_id, user_id) '
+        'SELECT id, user_id FROM products '
+        'WHERE NOT EXISTS (SELECT 1 FROM product_changes) '
+        'ORDER BY id'
+    )
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        for name, event, row, deleted in SQLITE_TRIGGERS:
+            op.execute(f'DROP TRIGGER IF EXISTS {name}')
+    elif bind.dialect.name == 'postgresql':
+        for name, event, transition in POSTGRESQL_TRIGGERS:
+            op.execute(f'DROP TRIGGER IF EXISTS {name} ON products')
+        op.execute('DROP FUNCTION IF EXISTS record_product_changes()')
+
+    for name, columns in reversed(INDEXES):
+        op.drop_index(name, table_name='product_changes')
+    op.drop_table('product_changes')
@@ -0,0 +1,68 @@
+"""products autoincrement
+
+Revision ID: e2b7d94c0f18
+Revises: c5e8a1f07d93
+Create Date: 2026-10-18 10:04:37.219846
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b7d94c0f18'
+down_revision = 'c5e8a1f07d93'
+branch_labels = None
+depends_on = None
+
+
+# SQLite hands the id of a deleted last product to the next insert unless
+# the table is AUTOINCREMENT, which takes rebuilding it (Postgres sequences
+# never reuse ids). The triggers on products (search index, change feed) go
+# with the old table, so they are recreated as they were.
+def rebuild_products(autoincrement):
+    bind = op.get_bind()
+    table_sql = bind.execute(
+        sa.text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'products'"
+        )
+    ).scalar()
+    if ('AUTOINCREMENT' in table_sql.upper()) == autoincrement:
+        return
+    triggers = bind.execute(
+        sa.text(
+            "SELECT sql FROM sqlite_master "
+            "WHERE type = 'trigger' AND tbl_name = 'products'"
+        )
+    ).scalars().all()
+    with op.batch_alter_table(
+        'products',
+        recreate='always',
+        table_kwargs={'sqlite_autoincrement': autoincrement},
+    ):
+        pass
+    for trigger_sql in triggers:
+        op.execute(trigger_sql)
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    rebuild_products(True)
+    # Ids deleted before the rebuild may still be in the change feed: start
+    # past them too
+    op.execute(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'products', 0 "
+        "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'products')"
+    )
+    op.execute(
+        'UPDATE sqlite_sequence SET seq = max(seq, '
+        '(SELECT coalesce(max(product_id), 0) FROM product_changes)) '
+        "WHERE name = 'products'"
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    rebuild_products(False)
@@ -0,0 +1,74 @@
+"""product search
+
+Revision ID: edc33d5412a3
+Revises: 7b7970bb43fa
+Create Date: 2026-10-17 11:40:03.118920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'edc33d5412a3'
+down_revision = '7b7970bb43fa'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    existing = {i['name'] for i in sa.inspect(bind).get_indexes('products')}
+    if 'ix_products_price_id' not in existing:
+        op.create_index('ix_products_price_id', 'products', ['price', 'id'])
+
+    if bind.dialect.name == 'postgresql':
+        op.execute(
+            "ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('simple', "
+            "coalesce(name, '') || ' ' || coalesce(description, ''))) STORED"
+        )
+        op.execute(
+            'CREATE INDEX IF NOT EXISTS ix_products_search_vector '
+            'ON products USING GIN (search_vector)'
+        )
+    elif bind.dialect.name == 'sqlite':
+        op.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5('
+            "name, description, content='products', content_rowid='id')"
+        )
+        op.execute(
+            'CREATE TRIGGER IF NOT EXISTS products_fts_insert '
+            'AFTER INSERT ON products BEGIN '
+            'INSERT INTO products_fts(rowid, name, description) '
+            'VALUES (new.id, new.name, new.description); END'
+        )
+        op.execute(
+            'CREATE TRIGGER IF NOT EXISTS products_fts_delete '
+            'AFTER DELETE ON products BEGIN '
+            'INSERT INTO products_fts(products_fts, rowid, name, description) '
+            "VALUES ('delete', old.id, old.name, old.description); END"
+        )
+        op.execute(
+            'CREATE TRIGGER IF NOT EXISTS products_fts_update '
+            'AFTER UPDATE ON products BEGIN '
+            'INSERT INTO products_fts(products_fts, rowid, name, description) '
+            "VALUES ('delete', old.id, old.name, old.description); "
+            'INSERT INTO products_fts(rowid, name, description) '
+            'VALUES (new.id, new.name, new.description); END'
+        )
+        op.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_products_search_vector')
+        op.execute('ALTER TABLE products DROP COLUMN IF EXISTS search_vector')
+    elif bind.dialect.name == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS products_fts_update')
+        op.execute('DROP TRIGGER IF EXISTS products_fts_delete')
+        op.execute('DROP TRIGGER IF EXISTS products_fts_insert')
+        op.execute('DROP TABLE IF EXISTS products_fts')
+
+    op.drop_index('ix_products_price_id', table_name='products')
@@ -0,0 +1,96 @@
+from extensions import db
+from serializers import model_serializer
+
+
+# User model
+class Users(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    email = db.Column(db.String(100), unique=True, nullable=False)
+    gender = db.Column(db.String(10), nullable=False)
+    password = db.Column(db.String(255), nullable=False)
+    products = db.relationship("Products", backref="Users", lazy=True)
+
+    def as_dict(self):
+        return user_as_dict(self)
+
+
+user_as_dict = model_serializer(Users, exclude=("password",))
+
+
+# Product model
+class Products(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text, nullable=True)
+    price = db.Column(db.Float, nullable=False)
+    # Image file, relative to IMAGE_STORAGE_DIR (see images.py)
+    img_path = db.Column(db.String(255), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+
+    __table_args__ = (
+        # Serves the owner-scoped lookups and the join to users
+        db.Index("ix_products_user_id_id", "user_id", "id"),
+        # Price filters and the price ordering of /api/products/search
+        db.Index("ix_products_price_id", "price", "id"),
+        # ids are never reused: the change feed and clients key on them
+        {"sqlite_autoincrement": True},
+    )
+
+
+# RevokedToken model
+class RevokedToken(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(120), index=True)
+    # expiry of the revoked token, rows are pruned once it has passed
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
+
+
+# Per-owner product statistics, maintained by the product write handlers in
+# their own transaction (see stats.apply_product_changes)
+class ProductStats(db.Model):
+    __tablename__ = "product_stats"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    product_count = db.Column(db.Integer, nullable=False)
+    price_sum = db.Column(db.Float, nullable=False)
+    price_min = db.Column(db.Float, nullable=True)
+    price_max = db.Column(db.Float, nullable=True)
+
+
+# Per-owner product count in each price bucket of stats.PRICE_BUCKETS
+class ProductPriceBucket(db.Model):
+    __tablename__ = "product_price_buckets"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)
+    product_count = db.Column(db.Integer, nullable=False)
+
+
+# Change log of the products table, one row per inserted, updated or deleted
+# product, written by triggers (see changes.py) and read by the change feed
+class ProductChange(db.Model):
+    __tablename__ = "product_changes"
+
+    seq = db.Column(
+        db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True
+    )
+    # Postgres id of the writing transaction, 0 on SQLite (see changes.py)
+    txid = db.Column(db.BigInteger, nullable=False, server_default="0")
+    # no foreign key: the log outlives the products
+    product_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False, server_default=db.false())
+    changed_at = db.Column(
+        db.DateTime, nullable=False, server_default=db.func.current_timestamp()
+    )
+
+    __table_args__ = (
+        # The feed of all products and of one owner's products, in order
+        db.Index("ix_product_changes_txid_seq", "txid", "seq"),
+        db.Index("ix_product_changes_user_id_txid_seq", "user_id", "txid", "seq"),
+        # Compaction: the later changes of a product
+        db.Index("ix_product_changes_product_id_seq", "product_id", "seq"),
+        # ids are never reused, even after the latest rows are deleted
+        {"sqlite_autoincrement": True},
+    )
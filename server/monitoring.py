@@ -0,0 +1,67 @@
+from flask import Blueprint, Response, current_app, jsonify
+from flask_jwt_extended import jwt_required
+
+from db_config import pool_status
+from extensions import async_db, db, response_cache, sql_instrumentation, user_cache
+
+# Pool telemetry and Prometheus metrics
+bp = Blueprint("monitoring", __name__)
+
+
+# Connection pool telemetry, to diagnose pool exhaustion under load, the
+# read replica routing counters when a replica is configured and the
+# admission control slots, queues and rejections
+@bp.route("/api/pool-stats", methods=["GET"])
+@jwt_required()
+def get_pool_stats():
+    stats = {
+        "pools": {
+            bind or "default": pool_status(engine)
+            for bind, engine in db.engines.items()
+        }
+    }
+    # the async views' engine, once started
+    if async_db.engine is not None:
+        stats["pools"]["async"] = pool_status(async_db.engine.sync_engine)
+    router = current_app.extensions.get("replica_router")
+    if router is not None:
+        stats["replica"] = router.status()
+    admission = current_app.extensions.get("admission")
+    if admission is not None:
+        stats["admission"] = admission.status()
+    return jsonify(stats), 200
+
+
+# Hit and miss counters and current size of a cache, from its stats()
+def cache_metrics(name, stats):
+    lines = []
+    for key, kind, help in (
+        ("hits", "counter", "Lookups answered from the cache."),
+        ("misses", "counter", "Lookups not found in the cache or expired."),
+        ("size", "gauge", "Entries in the cache."),
+        ("bytes", "gauge", "Bytes of the cached bodies."),
+    ):
+        if key not in stats:
+            continue
+        metric = f"{name}_{key}_total" if kind == "counter" else f"{name}_{key}"
+        lines += [
+            f"# HELP {metric} {help}",
+            f"# TYPE {metric} {kind}",
+            f"{metric} {stats[key]}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+# Per-route request latency, DB time and query count histograms in the
+# Prometheus text format, the response cache and user cache counters, plus
+# the group commit batch histograms when WRITE_COALESCING is on. Counted per
+# worker process.
+@bp.route("/metrics", methods=["GET"])
+def metrics():
+    body = sql_instrumentation.render_metrics()
+    body += cache_metrics("response_cache", response_cache.stats())
+    body += cache_metrics("user_cache", user_cache.stats())
+    committer = current_app.extensions.get("group_commit")
+    if committer is not None:
+        body += committer.render_metrics()
+    return Response(body, mimetype="text/plain; version=0.0.4")
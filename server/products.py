@@ -0,0 +1,707 @@
+import hashlib
+import io
+
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    jsonify,
+    request,
+    stream_with_context,
+)
+from flask_jwt_extended import jwt_required, get_current_user
+
+from admission import admit
+from bulk import (
+    FORMATS,
+    BulkImportError,
+    export_products,
+    import_products,
+    read_products,
+)
+from extensions import async_db, db, repository, response_cache
+from instrumentation import query_threshold_exempt
+from models import Products, Users
+from replicas import read_replica, reading_own_writes
+from search import search_products_query, search_terms
+from serializers import row_serializer
+from stats import (
+    apply_product_changes,
+    lock_owner_stats,
+    products_inserted,
+    rebuild_product_stats,
+)
+
+# Product CRUD, listings, search, batch and bulk endpoints
+bp = Blueprint("products", __name__)
+
+
+# Serve a JSON listing from response_cache with a strong ETag, answering
+# If-None-Match with 304. `build` returns the (response, status) to cache,
+# its X- headers are cached along with the body. A user reading their own
+# recent writes skips the lookup: the entry may hold stale replica reads,
+# and is replaced by what they read from the primary.
+def cached_json_response(scope, key, build):
+    cache_key = response_cache.key(scope, key)
+    cached = None if reading_own_writes() else response_cache.get(cache_key)
+    if cached is not None:
+        return cached_response(cached, "HIT")
+    return cached_response(store_response(cache_key, *build()), "MISS")
+
+
+# Same as cached_json_response() for async views, `build` is a coroutine
+async def cached_json_response_async(scope, key, build):
+    cache_key = response_cache.key(scope, key)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached_response(cached, "HIT")
+    return cached_response(store_response(cache_key, *(await build())), "MISS")
+
+
+def store_response(cache_key, response, status):
+    body = response.get_data()
+    headers = [
+        (name, value)
+        for name, value in response.headers.items()
+        if name.startswith("X-")
+    ]
+    cached = (body, status, headers, hashlib.sha256(body).hexdigest())
+    response_cache.set(cache_key, cached, size=len(body))
+    return cached
+
+
+def cached_response(cached, cache_status):
+    body, status, headers, etag = cached
+    response = Response(body, status, headers, mimetype="application/json")
+    response.headers["X-Cache"] = cache_status
+    if status != 200:
+        return response
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+# Called by every product write once it is committed
+def invalidate_product_listings(user_id):
+    response_cache.invalidate(("products", user_id))
+    response_cache.invalidate("all-products")
+
+
+# Create a new product associated with the authenticated user
+@bp.route("/api/products", methods=["POST"])
+@admit("writes")
+@jwt_required()
+def create_product():
+    # Retrieve the identity of the current user from the JWT
+    current_user = get_current_user()
+
+    data = request.get_json()
+    repository.add_product(
+        {
+            "name": data.get("name"),
+            "description": data.get("description"),
+            "price": data.get("price"),
+            "user_id": current_user["id"],
+        }
+    )
+    invalidate_product_listings(current_user["id"])
+    return jsonify({"message": "Product created successfully!"}), 201
+
+
+# Retrieve all products with their owner's username
+#
+# Without parameters the whole catalog is returned as before. `after_id` and
+# `limit` page through it by id (keyset pagination, the next cursor is sent in
+# the X-Next-After-Id header), and `stream=json|ndjson` streams it from a
+# server-side cursor so worker memory stays flat whatever the catalog size.
+@bp.route("/api/all-products", methods=["GET"])
+@admit("listings")
+@read_replica
+@jwt_required()
+def get_all_products_with_owners():
+    after_id, limit, stream, error = all_products_args()
+    if error:
+        return error
+
+    if stream:
+        return stream_products(
+            repository.stream_all_products(
+                after_id, limit, current_app.config["PRODUCTS_STREAM_CHUNK_SIZE"]
+            ),
+            ndjson=stream == "ndjson",
+        )
+
+    if limit is not None:
+        limit = min(limit, current_app.config["PRODUCTS_PAGE_MAX_LIMIT"])
+
+    def build():
+        return all_products_response(repository.all_products(after_id, limit), limit)
+
+    return cached_json_response("all-products", (after_id, limit), build)
+
+
+# Returns (after_id, limit, stream, error response)
+def all_products_args():
+    after_id = request.args.get("after_id", type=int)
+    limit = request.args.get("limit", type=int)
+    stream = request.args.get("stream")
+
+    if limit is not None and limit < 1:
+        error = jsonify({"message": "limit must be a positive integer"}), 400
+        return None, None, None, error
+    if stream is not None and stream not in ("json", "ndjson"):
+        error = jsonify({"message": "stream must be 'json' or 'ndjson'"}), 400
+        return None, None, None, error
+    return after_id, limit, stream, None
+
+
+# `products_with_owners` as dicts, see product_with_owner_as_dict
+def all_products_response(products_with_owners, limit):
+    response = jsonify(products_with_owners)
+    # a full page means there may be more rows after it
+    if limit is not None and len(products_with_owners) == limit:
+        response.headers["X-Next-After-Id"] = str(products_with_owners[-1]["id"])
+    return response, 200
+
+
+def all_products_query(after_id=None):
+    query = (
+        db.select(
+            Products.id,
+            Products.name,
+            Products.description,
+            Products.price,
+            Products.img_path,
+            Users.name.label("owner"),
+        )
+        .join(Users)
+        .order_by(Products.id)
+    )
+    if after_id is not None:
+        query = query.where(Products.id > after_id)
+    return query
+
+
+product_with_owner_as_dict = row_serializer(all_products_query())
+
+
+# Stream products as a JSON array or NDJSON, one chunk per partition (lists
+# of dicts, see Repository.stream_all_products)
+def stream_products(partitions, ndjson=False):
+    def dumps(obj):
+        return current_app.json.dumps(obj, separators=(",", ":"))
+
+    def generate():
+        if ndjson:
+            for partition in partitions:
+                yield "".join(dumps(product) + "\n" for product in partition)
+            return
+
+        yield "["
+        separator = ""
+        for partition in partitions:
+            yield separator + ",".join(dumps(product) for product in partition)
+            separator = ","
+        yield "]"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson" if ndjson else "application/json",
+    )
+
+
+# Get all products associated with the authenticated user
+@bp.route("/api/products", methods=["GET"])
+@admit("listings")
+@read_replica
+@jwt_required()
+def get_user_products():
+    # Retrieve the identity of the current user from the JWT
+    current_user = get_current_user()
+
+    def build():
+        return user_products_response(repository.user_products(current_user["id"]))
+
+    return cached_json_response(("products", current_user["id"]), None, build)
+
+
+# Column-only select, rows are serialized without loading Products instances
+def user_products_query(user_id):
+    return db.select(
+        Products.id,
+        Products.name,
+        Products.description,
+        Products.price,
+        Products.img_path,
+    ).where(Products.user_id == user_id)
+
+
+user_product_as_dict = row_serializer(user_products_query(None))
+
+
+# `products` as dicts, see user_product_as_dict
+def user_products_response(products):
+    if not products:
+        return jsonify({"message": "No products found"}), 404
+
+    return jsonify(products), 200
+
+
+# Async versions of the two listing views, swapped in by create_app() when
+# ASYNC_READS is set. They read through async_db (AsyncSession on a
+# dedicated event loop); the response cache and ETags behave the same.
+@admit("listings")
+@jwt_required()
+async def get_user_products_async():
+    current_user = get_current_user()
+
+    async def fetch(session):
+        result = await session.execute(user_products_query(current_user["id"]))
+        return user_product_as_dict.many(result)
+
+    async def build():
+        return user_products_response(await async_db.run(fetch))
+
+    return await cached_json_response_async(
+        ("products", current_user["id"]), None, build
+    )
+
+
+@admit("listings")
+@jwt_required()
+async def get_all_products_with_owners_async():
+    after_id, limit, stream, error = all_products_args()
+    if error:
+        return error
+
+    # Streaming keeps using the sync server-side cursor
+    if stream:
+        return stream_products(
+            repository.stream_all_products(
+                after_id, limit, current_app.config["PRODUCTS_STREAM_CHUNK_SIZE"]
+            ),
+            ndjson=stream == "ndjson",
+        )
+
+    query = all_products_query(after_id)
+    if limit is not None:
+        limit = min(limit, current_app.config["PRODUCTS_PAGE_MAX_LIMIT"])
+        query = query.limit(limit)
+
+    async def fetch(session):
+        return product_with_owner_as_dict.many(await session.execute(query))
+
+    async def build():
+        return all_products_response(await async_db.run(fetch), limit)
+
+    return await cached_json_response_async("all-products", (after_id, limit), build)
+
+
+# Search products: `q` is matched against name and description (full-text,
+# ranked), `min_price`/`max_price` and `owner` filter the results. Pages are
+# keyset-paginated, the cursor for the next one is sent in X-Next-Cursor and
+# passed back as `cursor`.
+@bp.route("/api/products/search", methods=["GET"])
+@admit("listings")
+@jwt_required()
+def search_products():
+    q = request.args.get("q", "")
+    min_price = request.args.get("min_price", type=float)
+    max_price = request.args.get("max_price", type=float)
+    owner = request.args.get("owner") or None
+    limit = request.args.get("limit", 50, type=int)
+    cursor = request.args.get("cursor")
+
+    if limit < 1:
+        return jsonify({"message": "limit must be a positive integer"}), 400
+    after = None
+    if cursor:
+        try:
+            sort_key, product_id = cursor.split(",")
+            after = (float(sort_key), int(product_id))
+        except ValueError:
+            return jsonify({"message": "Invalid cursor"}), 400
+
+    limit = min(limit, current_app.config["PRODUCTS_PAGE_MAX_LIMIT"])
+    query = search_products_query(
+        db.engine.dialect.name,
+        Products,
+        Users,
+        terms=search_terms(q),
+        min_price=min_price,
+        max_price=max_price,
+        owner=owner,
+        after=after,
+        limit=limit,
+    )
+    rows = db.session.execute(query).all()
+
+    serialize = row_serializer(query, product_with_owner_as_dict.fields)
+    response = jsonify(serialize.many(rows))
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = f"{rows[-1].sort_key!r},{rows[-1].id}"
+    return response, 200
+
+
+# Update a product
+@bp.route("/api/products/<int:product_id>", methods=["PUT"])
+@admit("writes")
+@jwt_required()
+def update_product(product_id):
+    # Retrieve the identity of the current user from the JWT
+    current_user = get_current_user()
+
+    data = request.get_json()
+    values = {
+        field: data[field]
+        for field in ("name", "description", "price")
+        if field in data
+    }
+
+    if not repository.update_product(product_id, current_user["id"], values):
+        return (
+            jsonify({"message": "Product not found or does not belong to the user"}),
+            404,
+        )
+
+    invalidate_product_listings(current_user["id"])
+    return jsonify({"message": "Product updated successfully!"}), 200
+
+
+def owned_product_query(product_id, user_id):
+    return Products.query.filter_by(id=product_id, user_id=user_id)
+
+
+# Delete a product
+@bp.route("/api/products/<int:product_id>", methods=["DELETE"])
+@admit("writes")
+@jwt_required()
+def delete_product(product_id):
+    # Retrieve the identity of the current user from the JWT
+    current_user = get_current_user()
+
+    if not repository.delete_product(product_id, current_user["id"]):
+        return (
+            jsonify({"message": "Product not found or does not belong to the user"}),
+            404,
+        )
+
+    invalidate_product_listings(current_user["id"])
+    return jsonify({"message": "Product deleted successfully!"}), 200
+
+
+# Validate the product fields of a batch item, returns an error message or None
+def product_fields_error(item, partial=False):
+    if not partial or "name" in item:
+        name = item.get("name")
+        if not isinstance(name, str) or not name.strip() or len(name) > 100:
+            return "name must be a non-empty string of at most 100 characters"
+    if not partial or "price" in item:
+        price = item.get("price")
+        if isinstance(price, bool) or not isinstance(price, (int, float)):
+            return "price must be a number"
+    description = item.get("description")
+    if description is not None and not isinstance(description, str):
+        return "description must be a string"
+    return None
+
+
+# Check the body of a batch request, returns (items, error response)
+def batch_items(validate):
+    items = request.get_json(silent=True)
+    if not isinstance(items, list) or not items:
+        return None, (jsonify({"message": "Expected a non-empty JSON array"}), 400)
+    if len(items) > current_app.config["PRODUCTS_BATCH_MAX_SIZE"]:
+        return None, (
+            jsonify(
+                {
+                    "message": "Batch is limited to %d items"
+                    % current_app.config["PRODUCTS_BATCH_MAX_SIZE"]
+                }
+            ),
+            400,
+        )
+
+    errors = []
+    for index, item in enumerate(items):
+        error = validate(item)
+        if error:
+            errors.append({"index": index, "message": error})
+    if errors:
+        # Nothing is written unless the whole batch is valid
+        return None, (jsonify({"message": "Invalid batch", "errors": errors}), 400)
+    return items, None
+
+
+def batch_item_id_error(item):
+    product_id = item.get("id") if isinstance(item, dict) else item
+    if isinstance(product_id, bool) or not isinstance(product_id, int):
+        return "id must be an integer"
+    return None
+
+
+def unique_ids_error(ids):
+    if len(set(ids)) != len(ids):
+        return jsonify({"message": "Duplicate product ids in batch"}), 400
+    return None
+
+
+# Run after stats.lock_owner_stats(): the old prices feed the stats update
+def owned_product_prices_query(ids, user_id):
+    return db.select(Products.price, Products.id).where(
+        Products.id.in_(ids), Products.user_id == user_id
+    )
+
+
+def delete_owned_products_query(ids, user_id):
+    return (
+        db.delete(Products)
+        .where(Products.id.in_(ids), Products.user_id == user_id)
+        .returning(Products.id, Products.price)
+    )
+
+
+# Create many products with one multi-row INSERT
+@bp.route("/api/products/batch", methods=["POST"])
+@admit("writes")
+@jwt_required()
+def create_products_batch():
+    current_user = get_current_user()
+
+    def validate(item):
+        if not isinstance(item, dict):
+            return "item must be an object"
+        return product_fields_error(item)
+
+    items, error = batch_items(validate)
+    if error:
+        return error
+
+    rows = [
+        {
+            "name": item["name"],
+            "description": item.get("description"),
+            "price": item["price"],
+            "user_id": current_user["id"],
+        }
+        for item in items
+    ]
+    # Ids come from one statement and are allocated in VALUES order
+    product_ids = sorted(
+        db.session.execute(
+            db.insert(Products).values(rows).returning(Products.id)
+        ).scalars()
+    )
+    products_inserted(db.session.connection(), rows)
+    db.session.commit()
+    invalidate_product_listings(current_user["id"])
+
+    results = [
+        {"index": index, "id": product_id, "status": 201}
+        for index, product_id in enumerate(product_ids)
+    ]
+    return (
+        jsonify({"message": "Products created successfully!", "results": results}),
+        201,
+    )
+
+
+# Update many products; each item holds the product id plus the fields to set
+@bp.route("/api/products/batch", methods=["PUT"])
+@admit("writes")
+@jwt_required()
+def update_products_batch():
+    current_user = get_current_user()
+
+    def validate(item):
+        if not isinstance(item, dict):
+            return "item must be an object"
+        return batch_item_id_error(item) or product_fields_error(item, partial=True)
+
+    items, error = batch_items(validate)
+    if error:
+        return error
+    ids = [item["id"] for item in items]
+    error = unique_ids_error(ids)
+    if error:
+        return error
+
+    # One query to keep only the products owned by the user
+    lock_owner_stats(db.session.connection(), current_user["id"])
+    old_prices = {
+        row.id: row.price
+        for row in db.session.execute(
+            owned_product_prices_query(ids, current_user["id"])
+        )
+    }
+    owned = set(old_prices)
+    updates = [
+        {
+            field: item[field]
+            for field in ("id", "name", "description", "price")
+            if field in item
+        }
+        for item in items
+        if item["id"] in owned
+    ]
+    # ORM bulk UPDATE by primary key: one executemany per set of fields
+    updates = [values for values in updates if len(values) > 1]
+    if updates:
+        db.session.execute(db.update(Products), updates)
+        apply_product_changes(
+            db.session.connection(),
+            [
+                (current_user["id"], old_prices[values["id"]], values["price"])
+                for values in updates
+                if "price" in values
+            ],
+        )
+    db.session.commit()
+    invalidate_product_listings(current_user["id"])
+
+    results = [
+        (
+            {"index": index, "id": item["id"], "status": 200}
+            if item["id"] in owned
+            else {
+                "index": index,
+                "id": item["id"],
+                "status": 404,
+                "message": "Product not found or does not belong to the user",
+            }
+        )
+        for index, item in enumerate(items)
+    ]
+    return jsonify({"message": "Batch update processed", "results": results}), 200
+
+
+# Delete many products with one DELETE ... WHERE id IN (...) scoped to the owner
+@bp.route("/api/products/batch", methods=["DELETE"])
+@admit("writes")
+@jwt_required()
+def delete_products_batch():
+    current_user = get_current_user()
+
+    # Items may be plain ids or objects with an "id"
+    items, error = batch_items(batch_item_id_error)
+    if error:
+        return error
+    ids = [item["id"] if isinstance(item, dict) else item for item in items]
+    error = unique_ids_error(ids)
+    if error:
+        return error
+
+    deleted_rows = db.session.execute(
+        delete_owned_products_query(ids, current_user["id"]).execution_options(
+            synchronize_session=False
+        )
+    ).all()
+    apply_product_changes(
+        db.session.connection(),
+        [(current_user["id"], row.price, None) for row in deleted_rows],
+    )
+    db.session.commit()
+    deleted = {row.id for row in deleted_rows}
+    invalidate_product_listings(current_user["id"])
+
+    results = [
+        (
+            {"index": index, "id": product_id, "status": 200}
+            if product_id in deleted
+            else {
+                "index": index,
+                "id": product_id,
+                "status": 404,
+                "message": "Product not found or does not belong to the user",
+            }
+        )
+        for index, product_id in enumerate(ids)
+    ]
+    return jsonify({"message": "Batch delete processed", "results": results}), 200
+
+
+# Bulk import of products for the current user, as CSV (header row with
+# name, price and optionally description) or NDJSON. The body is parsed as it
+# is received and written in batches within one transaction: an invalid row
+# rejects the whole file. The owner's stats are then recomputed once.
+# `format` defaults to the request's Content-Type.
+@bp.route("/api/products/import", methods=["POST"])
+@admit("writes")
+@query_threshold_exempt
+@jwt_required()
+def import_user_products():
+    current_user = get_current_user()
+    fmt = request.args.get("format") or (
+        "csv" if request.mimetype == "text/csv" else "ndjson"
+    )
+    if fmt not in FORMATS:
+        return jsonify({"message": "format must be 'csv' or 'ndjson'"}), 400
+
+    stream = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+    try:
+        count = import_products(
+            db.session.connection(),
+            Products.__table__,
+            read_products(stream, fmt),
+            current_user["id"],
+            validate=product_fields_error,
+            batch_size=current_app.config["PRODUCTS_IMPORT_BATCH_SIZE"],
+        )
+    except (BulkImportError, UnicodeDecodeError) as error:
+        db.session.rollback()
+        line = getattr(error, "line", None)
+        return jsonify({"message": f"Invalid import: {error}", "line": line}), 400
+
+    rebuild_product_stats(db.session.connection(), [current_user["id"]])
+    db.session.commit()
+    invalidate_product_listings(current_user["id"])
+    return jsonify({"message": "Products imported successfully!", "count": count}), 201
+
+
+# Stream the current user's products as CSV or NDJSON
+@bp.route("/api/products/export", methods=["GET"])
+@admit("listings")
+@jwt_required()
+def export_user_products():
+    current_user = get_current_user()
+    fmt = request.args.get("format", "csv")
+    if fmt not in FORMATS:
+        return jsonify({"message": "format must be 'csv' or 'ndjson'"}), 400
+
+    query = export_products_query(current_user["id"])
+
+    def generate():
+        yield from export_products(export_result(query), fmt, dumps=compact_dumps)
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype="text/csv" if fmt == "csv" else "application/x-ndjson",
+    )
+    response.headers["Content-Disposition"] = f"attachment; filename=products.{fmt}"
+    return response
+
+
+def export_products_query(user_id=None):
+    query = db.select(
+        Products.id,
+        Products.name,
+        Products.description,
+        Products.price,
+        Products.user_id,
+    ).order_by(Products.id)
+    if user_id is not None:
+        query = query.where(Products.user_id == user_id)
+    return query
+
+
+# Rows fetched `PRODUCTS_STREAM_CHUNK_SIZE` at a time (a server-side cursor on
+# Postgres), so exports run in constant memory
+def export_result(query):
+    return db.session.execute(
+        query.execution_options(
+            yield_per=current_app.config["PRODUCTS_STREAM_CHUNK_SIZE"]
+        )
+    )
+
+
+def compact_dumps(obj):
+    return current_app.json.dumps(obj, separators=(",", ":"))
@@ -0,0 +1,64 @@
+import json
+
+
+# Render a statement the way the database will see it, with the IN lists
+# expanded, and return (sql, parameters) for exec_driver_sql()
+def _compile(statement, dialect):
+    compiled = statement.compile(
+        dialect=dialect, compile_kwargs={"render_postcompile": True}
+    )
+    params = compiled.construct_params()
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    return compiled.string, params
+
+
+def explain(connection, statement):
+    dialect = connection.dialect
+    sql, params = _compile(statement, dialect)
+    if dialect.name == "sqlite":
+        rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, params)
+        return [row[-1] for row in rows]
+    if dialect.name == "postgresql":
+        row = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = row.scalar()
+        return plan if isinstance(plan, list) else json.loads(plan)
+    raise NotImplementedError(f"EXPLAIN is not supported for {dialect.name}")
+
+
+# Sequential (full table) scans found in a plan returned by explain()
+def sequential_scans(dialect_name, plan):
+    if dialect_name == "sqlite":
+        # "SCAN products" or "SCAN products USING COVERING INDEX ..." both
+        # visit every row, "SEARCH ..." is an index lookup. FTS5 lookups show
+        # up as "SCAN products_fts VIRTUAL TABLE INDEX ..."
+        return [
+            step
+            for step in plan
+            if step.startswith("SCAN ") and "VIRTUAL TABLE INDEX" not in step
+        ]
+
+    scans = []
+
+    def walk(node):
+        if node.get("Node Type") == "Seq Scan":
+            scans.append("Seq Scan on " + node.get("Relation Name", "?"))
+        for child in node.get("Plans", []):
+            walk(child)
+
+    for entry in plan:
+        walk(entry["Plan"])
+    return scans
+
+
+# Explain every named statement; returns {name: [sequential scans]} for the
+# ones that would read a whole table
+def check_query_plans(connection, statements):
+    failures = {}
+    for name, statement in statements.items():
+        scans = sequential_scans(
+            connection.dialect.name, explain(connection, statement)
+        )
+        if scans:
+            failures[name] = scans
+    return failures
@@ -0,0 +1,174 @@
+import functools
+import threading
+import time
+
+from flask import (
+    current_app,
+    g,
+    has_app_context,
+    has_request_context,
+    request,
+    request_finished,
+)
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session
+from sqlalchemy import exc
+
+from caching import TTLCache
+
+# SQLALCHEMY_BINDS key of the read replica
+REPLICA_BIND = "replica"
+
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+
+# Sends the reads of @read_replica views to the replica bind, everything else
+# (and every flush) to the primary. Used as the session class of `db`.
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or self._flushing or not has_app_context():
+            return engine
+        router = current_app.extensions.get("replica_router")
+        if router is None or engine is not self._db.engines.get(None):
+            return engine
+        return router.engine_for_read(self._db) or engine
+
+
+# Replica routing state of one app.
+#
+# A request is only served from the replica once its token is verified
+# (statements run before that use the primary), and
+# only if the user hasn't written anything in the last `sticky_seconds`:
+# their own changes may not have replicated yet (read-your-writes). Any
+# database error on the replica retries the view on the primary and keeps
+# reads there for `retry_seconds`.
+#
+# Stickiness is tracked per worker process, size it for the replication lag
+# and route a user's requests to the same worker where that matters.
+class ReplicaRouter:
+    def __init__(self, app=None, sticky_seconds=5, retry_seconds=30,
+                 maxsize=10000):
+        self.retry_seconds = retry_seconds
+        self._writers = TTLCache(maxsize=maxsize, ttl=sticky_seconds)
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+        self.counts = {"replica": 0, "sticky": 0, "fallback": 0, "down": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        request_finished.connect(self._request_finished, app, weak=False)
+
+    def available(self):
+        return time.monotonic() >= self._down_until
+
+    def mark_down(self, error):
+        with self._lock:
+            self._down_until = time.monotonic() + self.retry_seconds
+            self.counts["fallback"] += 1
+        self.app.logger.warning(
+            "Read replica failed, using the primary for %ss: %s",
+            self.retry_seconds,
+            error,
+        )
+
+    def mark_written(self, user_id):
+        self._writers.set(str(user_id), True)
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    # Where the reads of the current request go: "replica", "sticky" or
+    # "down" (both on the primary), or None outside @read_replica views and
+    # until the token is verified. Decided once per request.
+    def route(self):
+        if not has_request_context() or not g.get("_read_replica"):
+            return None
+        route = g.get("_replica_route")
+        if route is None:
+            identity = current_identity()
+            if identity is None:
+                return None
+            if not self.available():
+                route = "down"
+            elif self._writers.get(str(identity)):
+                route = "sticky"
+            else:
+                route = "replica"
+            g._replica_route = route
+            self._count(route)
+        return route
+
+    def engine_for_read(self, db):
+        if self.route() != "replica":
+            return None
+        return db.engines[REPLICA_BIND]
+
+    def _request_finished(self, sender, response, **extra):
+        if request.method not in WRITE_METHODS or response.status_code >= 400:
+            return
+        identity = current_identity()
+        if identity is not None:
+            self.mark_written(identity)
+
+    def status(self):
+        with self._lock:
+            counts = dict(self.counts)
+        return {
+            "available": self.available(),
+            "sticky_users": len(self._writers),
+            "requests": counts,
+        }
+
+
+def current_identity():
+    identity = g.get("_replica_identity")
+    if identity is not None:
+        return identity
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        # no token verified in this request (yet)
+        return None
+
+
+# Called by the user lookup loader with the subject of the verified token, so
+# the user lookup itself can already be routed (flask_jwt_extended only
+# exposes the identity once the user is loaded)
+def set_request_identity(identity):
+    g._replica_identity = identity
+
+
+# True when a @read_replica request reads from the primary because its user
+# wrote recently: anything cached from replica reads may be stale for it
+def reading_own_writes():
+    router = current_app.extensions.get("replica_router")
+    return router is not None and router.route() == "sticky"
+
+
+# Serve a read-only view from the read replica when one is configured (put it
+# right under the route decorator). On a database error on the replica the
+# view is run again on the primary, so it must not write anything. Streamed
+# responses read the replica as they are sent and can't fall back.
+def read_replica(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        router = current_app.extensions.get("replica_router")
+        if router is None:
+            return view(*args, **kwargs)
+
+        g._read_replica = True
+        try:
+            return view(*args, **kwargs)
+        except exc.DBAPIError as error:
+            if router.route() != "replica":
+                raise
+            router.mark_down(error)
+            current_app.extensions["sqlalchemy"].session.rollback()
+            g._read_replica = False
+            return view(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,235 @@
+import bisect
+import itertools
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+
+# Storage of users, products and revoked tokens behind the auth and product
+# CRUD handlers, selected by the REPOSITORY setting: the SQLAlchemy
+# repository (sql_repository.py, the default) writes to the database,
+# InMemoryRepository keeps everything in dicts of the worker process, for
+# test suites and benchmarks that should run at memory speed. This module
+# only uses the standard library, so scripts can use InMemoryRepository
+# without the app's extensions.
+#
+# Both take and return plain dicts: users as models.user_as_dict() (plus
+# "password" where the hash is needed), products with the fields of the
+# product listings.
+USER_FIELDS = ("id", "name", "email", "gender")
+PRODUCT_FIELDS = ("id", "name", "description", "price", "img_path")
+
+
+class Repository(ABC):
+    # Called in forked children, see factory._reset_after_fork()
+    @abstractmethod
+    def reset_after_fork(self):
+        pass
+
+    # The user without its password hash, None if there is no such id
+    @abstractmethod
+    def get_user(self, user_id):
+        pass
+
+    # The user with its password hash, None if there is no such email
+    @abstractmethod
+    def get_user_by_email(self, email):
+        pass
+
+    # Returns the new user, without its password hash
+    @abstractmethod
+    def add_user(self, name, email, gender, password):
+        pass
+
+    @abstractmethod
+    def set_user_password(self, user_id, password):
+        pass
+
+    # `values` has the product fields and user_id; returns the new product id
+    @abstractmethod
+    def add_product(self, values):
+        pass
+
+    # The product with its user_id, None if there is no such id
+    @abstractmethod
+    def get_product(self, product_id):
+        pass
+
+    # The products of a user, with PRODUCT_FIELDS
+    @abstractmethod
+    def user_products(self, user_id):
+        pass
+
+    # Products with their owner's name, by id, after `after_id`
+    @abstractmethod
+    def all_products(self, after_id=None, limit=None):
+        pass
+
+    # Same as all_products(), yielded in lists of up to `chunk_size`
+    @abstractmethod
+    def stream_all_products(self, after_id=None, limit=None, chunk_size=500):
+        pass
+
+    # Set `values` on a product of the user; returns whether it was found
+    @abstractmethod
+    def update_product(self, product_id, user_id, values):
+        pass
+
+    # Returns whether the product of the user was found
+    @abstractmethod
+    def delete_product(self, product_id, user_id):
+        pass
+
+    # Revoke a token until its expiry `exp` (a unix timestamp, or None)
+    @abstractmethod
+    def revoke_token(self, jti, exp):
+        pass
+
+    # Checked for every @jwt_required() request
+    @abstractmethod
+    def is_token_revoked(self, jti):
+        pass
+
+
+# Users and products in dicts indexed by id, user email and product owner,
+# behind one lock. Ids come from counters, so they are never reused after a
+# delete, and ascend: product ids are kept in a sorted list for keyset
+# pages. Rows are copied in and out, callers never share them. Each worker
+# process has its own data, lost on restart.
+class InMemoryRepository(Repository):
+    def __init__(self):
+        self._users = {}  # id -> user, with its password hash
+        self._user_ids_by_email = {}
+        self._user_names = set()
+        self._products = {}  # id -> product
+        self._product_ids = []
+        self._products_by_owner = defaultdict(dict)  # user id -> {id: product}
+        self._next_user_id = itertools.count(1)
+        self._next_product_id = itertools.count(1)
+        self._revoked_tokens = {}  # jti -> expiry (unix timestamp or None)
+        self.reset_after_fork()
+
+    # A lock held by another thread at fork time would never be released
+    def reset_after_fork(self):
+        self._lock = threading.Lock()
+
+    def get_user(self, user_id):
+        with self._lock:
+            user = self._users.get(user_id)
+            return {field: user[field] for field in USER_FIELDS} if user else None
+
+    def get_user_by_email(self, email):
+        with self._lock:
+            user_id = self._user_ids_by_email.get(email)
+            return dict(self._users[user_id]) if user_id is not None else None
+
+    # Names and emails are unique, as in the users table
+    def add_user(self, name, email, gender, password):
+        with self._lock:
+            if email in self._user_ids_by_email:
+                raise ValueError(f"email {email!r} already exists")
+            if name in self._user_names:
+                raise ValueError(f"name {name!r} already exists")
+            user = {
+                "id": next(self._next_user_id),
+                "name": name,
+                "email": email,
+                "gender": gender,
+                "password": password,
+            }
+            self._users[user["id"]] = user
+            self._user_ids_by_email[email] = user["id"]
+            self._user_names.add(name)
+            return {field: user[field] for field in USER_FIELDS}
+
+    def set_user_password(self, user_id, password):
+        with self._lock:
+            if user_id in self._users:
+                self._users[user_id]["password"] = password
+
+    def add_product(self, values):
+        with self._lock:
+            product = {
+                "id": next(self._next_product_id),
+                "name": values["name"],
+                "description": values.get("description"),
+                "price": values["price"],
+                "img_path": values.get("img_path"),
+                "user_id": values["user_id"],
+            }
+            self._products[product["id"]] = product
+            self._product_ids.append(product["id"])
+            self._products_by_owner[product["user_id"]][product["id"]] = product
+            return product["id"]
+
+    def get_product(self, product_id):
+        with self._lock:
+            product = self._products.get(product_id)
+            return dict(product) if product is not None else None
+
+    def user_products(self, user_id):
+        with self._lock:
+            owned = self._products_by_owner.get(user_id, {})
+            return [
+                {field: product[field] for field in PRODUCT_FIELDS}
+                for product in owned.values()
+            ]
+
+    def all_products(self, after_id=None, limit=None):
+        with self._lock:
+            start = bisect.bisect_right(self._product_ids, after_id or 0)
+            end = len(self._product_ids) if limit is None else start + limit
+            return [
+                self._with_owner(self._products[product_id])
+                for product_id in self._product_ids[start:end]
+            ]
+
+    # The lock is taken per chunk, writers aren't held up by a slow client
+    def stream_all_products(self, after_id=None, limit=None, chunk_size=500):
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            chunk = self.all_products(after_id, size)
+            if not chunk:
+                return
+            yield chunk
+            after_id = chunk[-1]["id"]
+            if remaining is not None:
+                remaining -= len(chunk)
+
+    # None for products whose owner isn't a user of the repository
+    def _with_owner(self, product):
+        row = {field: product[field] for field in PRODUCT_FIELDS}
+        owner = self._users.get(product["user_id"])
+        row["owner"] = owner["name"] if owner is not None else None
+        return row
+
+    def update_product(self, product_id, user_id, values):
+        with self._lock:
+            product = self._products.get(product_id)
+            if product is None or product["user_id"] != user_id:
+                return False
+            product.update(
+                (field, values[field])
+                for field in PRODUCT_FIELDS[1:]
+                if field in values
+            )
+            return True
+
+    def delete_product(self, product_id, user_id):
+        with self._lock:
+            product = self._products.get(product_id)
+            if product is None or product["user_id"] != user_id:
+                return False
+            del self._products[product_id]
+            del self._products_by_owner[product["user_id"]][product_id]
+            del self._product_ids[bisect.bisect_left(self._product_ids, product_id)]
+            return True
+
+    def revoke_token(self, jti, exp):
+        with self._lock:
+            self._revoked_tokens[jti] = exp
+
+    # Revoked tokens are kept until restart, like the rest
+    def is_token_revoked(self, jti):
+        with self._lock:
+            return jti in self._revoked_tokens
@@ -0,0 +1,116 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, select
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def exp_to_datetime(exp):
+    # JWT "exp" is a unix timestamp; the column stores naive UTC
+    return datetime.fromtimestamp(exp, timezone.utc).replace(tzinfo=None)
+
+
+# In-process mirror of the RevokedToken table.
+#
+# Every unexpired revoked jti is kept in memory, so a lookup for a token that
+# is NOT revoked is answered without touching the database. The mirror is
+# refreshed incrementally (rows with an id above the last one seen) at most
+# once per `refresh_interval`, and fully reloaded every `full_reload_interval`
+# to pick up rows that committed out of id order in other workers. Revocations
+# made by this process are visible immediately through `add()`.
+class RevocationCache:
+    def __init__(
+        self,
+        db,
+        model,
+        refresh_interval=5.0,
+        full_reload_interval=60.0,
+        prune_interval=3600.0,
+    ):
+        self.db = db
+        self.model = model
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self.prune_interval = prune_interval
+
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._revoked = {}  # jti -> expiry (unix timestamp, None if unknown)
+        self._last_id = 0
+        self._next_refresh = 0.0
+        self._next_full_reload = 0.0
+        self._next_prune = time.monotonic() + prune_interval
+
+    def is_revoked(self, jti):
+        self._maybe_refresh()
+        return jti in self._revoked
+
+    def add(self, jti, exp=None):
+        with self._lock:
+            self._revoked[jti] = exp
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if now < self._next_refresh:
+            return
+
+        # Only one thread refreshes; the others keep answering from the
+        # current (at most one interval stale) snapshot.
+        with self._lock:
+            if self._refreshing or now < self._next_refresh:
+                return
+            self._refreshing = True
+
+        try:
+            if now >= self._next_prune:
+                self.prune()
+                self._next_prune = now + self.prune_interval
+            self.refresh(full=now >= self._next_full_reload)
+        finally:
+            with self._lock:
+                self._refreshing = False
+                self._next_refresh = now + self.refresh_interval
+                if now >= self._next_full_reload:
+                    self._next_full_reload = now + self.full_reload_interval
+
+    def refresh_query(self, full=False):
+        model = self.model
+        query = select(model.id, model.jti, model.expires_at)
+        if full:
+            return query.where(
+                (model.expires_at.is_(None)) | (model.expires_at > _utcnow())
+            )
+        return query.where(model.id > self._last_id)
+
+    def prune_query(self):
+        return delete(self.model).where(self.model.expires_at < _utcnow())
+
+    def refresh(self, full=False):
+        with self.db.engine.connect() as connection:
+            rows = connection.execute(self.refresh_query(full)).all()
+
+        now = time.time()
+        with self._lock:
+            revoked = dict(self._revoked)
+            for row_id, jti, expires_at in rows:
+                exp = (
+                    expires_at.replace(tzinfo=timezone.utc).timestamp()
+                    if expires_at is not None
+                    else None
+                )
+                if exp is None or exp > now:
+                    revoked[jti] = exp
+                self._last_id = max(self._last_id, row_id)
+            # expired tokens are rejected by the JWT "exp" check already
+            self._revoked = {
+                jti: exp for jti, exp in revoked.items() if exp is None or exp > now
+            }
+
+    def prune(self):
+        with self.db.engine.begin() as connection:
+            result = connection.execute(self.prune_query())
+        return result.rowcount
@@ -0,0 +1,151 @@
+import re
+
+from sqlalchemy import (
+    Double,
+    and_,
+    cast,
+    column,
+    func,
+    literal_column,
+    or_,
+    select,
+    table,
+    text,
+    tuple_,
+)
+
+# SQLite FTS5 index over products.name and products.description, kept in
+# sync by triggers. Postgres uses the generated products.search_vector
+# column and its GIN index instead. Both are created by the
+# "product search" migration; ensure_search_schema() does the same for
+# databases built with db.create_all().
+SQLITE_SEARCH_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, description, content='products', content_rowid='id'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products
+    BEGIN
+        INSERT INTO products_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products
+    BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE ON products
+    BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO products_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END""",
+    "INSERT INTO products_fts(products_fts) VALUES ('rebuild')",
+]
+
+POSTGRESQL_SEARCH_SCHEMA = [
+    """ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(description, ''))
+    ) STORED""",
+    """CREATE INDEX IF NOT EXISTS ix_products_search_vector
+    ON products USING GIN (search_vector)""",
+]
+
+products_fts = table("products_fts", column("rowid"))
+
+
+def ensure_search_schema(connection):
+    statements = {
+        "sqlite": SQLITE_SEARCH_SCHEMA,
+        "postgresql": POSTGRESQL_SEARCH_SCHEMA,
+    }.get(connection.dialect.name, [])
+    for statement in statements:
+        connection.execute(text(statement))
+
+
+# Words of a search string; each one is matched as a prefix
+def search_terms(q):
+    return re.findall(r"\w+", q.lower())
+
+
+# (match condition, rank) for the full-text part of a search. A lower rank
+# is a better match on every backend.
+def full_text_match(dialect_name, terms):
+    if dialect_name == "sqlite":
+        match = literal_column("products_fts").op("MATCH")(
+            " ".join(f'"{term}"*' for term in terms)
+        )
+        return match, func.bm25(literal_column("products_fts"))
+
+    if dialect_name == "postgresql":
+        search_vector = literal_column("products.search_vector")
+        query = func.to_tsquery("simple", " & ".join(f"{term}:*" for term in terms))
+        # ts_rank() is a float4: compared as float8 to the cursor's value it
+        # would no longer match the rows tied with it
+        rank = cast(func.ts_rank(search_vector, query), Double)
+        return search_vector.op("@@")(query), -rank
+
+    raise NotImplementedError(f"Full-text search isn't supported on {dialect_name}")
+
+
+# Ranked product search, keyset-paginated on (sort key, id).
+#
+# With search terms rows are ordered by rank, otherwise by price; `after` is
+# the (sort key, id) of the last row of the previous page. Each row has the
+# product columns, its owner's name and the `sort_key`.
+def search_products_query(
+    dialect_name,
+    products,
+    users,
+    terms=None,
+    min_price=None,
+    max_price=None,
+    owner=None,
+    after=None,
+    limit=50,
+):
+    if terms:
+        match, sort_key = full_text_match(dialect_name, terms)
+    else:
+        match, sort_key = None, products.price
+
+    query = select(
+        products.id,
+        products.name,
+        products.description,
+        products.price,
+        products.img_path,
+        users.name.label("owner"),
+        sort_key.label("sort_key"),
+    )
+    if match is not None:
+        if dialect_name == "sqlite":
+            query = query.select_from(products_fts).join(
+                products, products.id == products_fts.c.rowid
+            )
+        query = query.where(match)
+    query = query.join(users, users.id == products.user_id)
+
+    if min_price is not None:
+        query = query.where(products.price >= min_price)
+    if max_price is not None:
+        query = query.where(products.price <= max_price)
+    if owner is not None:
+        query = query.where(users.name == owner)
+
+    if after is not None:
+        last_key, last_id = after
+        if match is None:
+            query = query.where(
+                tuple_(products.price, products.id) > tuple_(last_key, last_id)
+            )
+        else:
+            query = query.where(
+                or_(
+                    sort_key > last_key,
+                    and_(sort_key == last_key, products.id > last_id),
+                )
+            )
+
+    return query.order_by(sort_key, products.id).limit(limit)
@@ -0,0 +1,96 @@
+from functools import lru_cache
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the stdlib encoder
+    orjson = None
+
+
+# Serializers are plain functions generated once per model or query shape, so
+# turning a row into a dict costs one dict literal with indexed lookups
+# instead of walking the table columns on every call.
+#
+#   serialize = row_serializer(query)       # or model_serializer(Users, ...)
+#   serialize.many(rows)                    # list of dicts, ready for jsonify
+def _build(fields, accessor):
+    items = ", ".join(f"{field!r}: {accessor(i, field)}" for i, field in fields)
+    source = (
+        f"def one(row):\n    return {{{items}}}\n"
+        f"def many(rows):\n    return [{{{items}}} for row in rows]\n"
+    )
+    namespace = {}
+    exec(source, namespace)
+    one = namespace["one"]
+    one.many = namespace["many"]
+    one.fields = tuple(field for _, field in fields)
+    return one
+
+
+# Serializer for the `Row` tuples of a column-only select whose columns are
+# named `keys`; only `fields` (default: every column) end up in the dict
+@lru_cache(maxsize=256)
+def _row_serializer(keys, fields):
+    positions = {key: i for i, key in enumerate(keys)}
+    missing = [field for field in fields if field not in positions]
+    if missing:
+        raise KeyError(f"Columns not selected: {', '.join(missing)}")
+    return _build(
+        [(positions[field], field) for field in fields],
+        lambda i, field: f"row[{i}]",
+    )
+
+
+def row_serializer(query, fields=None):
+    keys = tuple(query.selected_columns.keys())
+    return _row_serializer(keys, tuple(fields) if fields is not None else keys)
+
+
+# Serializer for ORM instances of `model`, leaving out the `exclude` columns
+@lru_cache(maxsize=None)
+def model_serializer(model, exclude=()):
+    fields = [
+        column.key for column in model.__table__.columns if column.key not in exclude
+    ]
+    return _build(list(enumerate(fields)), lambda i, field: f"row.{field}")
+
+
+# Flask JSON provider encoding with orjson when it is installed. Output
+# decodes to the same values as the default provider's (sorted keys,
+# compact outside debug mode, dates and decimals through its `default`),
+# with one intended difference: non-ASCII characters are written as UTF-8
+# instead of \uXXXX escapes (ensure_ascii), which JSON allows and which is
+# smaller. Anything orjson can't encode, such as integers wider than 64
+# bits, goes through the stdlib encoder.
+class FastJSONProvider(DefaultJSONProvider):
+    def _orjson_dumps(self, obj, indent=False):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        # Only the compact encoding is served by orjson
+        if orjson is not None and kwargs == {"separators": (",", ":")}:
+            try:
+                return self._orjson_dumps(obj).decode()
+            except orjson.JSONEncodeError:
+                pass
+        return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (
+            self.compact is None and self._app.debug
+        )
+        try:
+            body = self._orjson_dumps(obj, indent=indent)
+        except orjson.JSONEncodeError:
+            return super().response(obj)
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
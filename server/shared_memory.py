@@ -0,0 +1,51 @@
+import contextlib
+import fcntl
+import mmap
+import os
+import threading
+
+
+# A file of `size` bytes memory-mapped by every worker process of a server
+# (put it on tmpfs, e.g. /dev/shm), with locked() serializing its updates.
+# It is opened on first use, and again by each process after a fork
+# (reset_after_fork()): flock is held per open file, so a child using its
+# parent's would not be excluded by it.
+class SharedFile:
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.reset_after_fork()
+
+    def reset_after_fork(self):
+        self._thread_lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._file = None
+        self.map = None
+
+    # The mapping; the file is created or grown to `size` as needed
+    def open(self):
+        if self.map is None:
+            with self._open_lock:
+                if self.map is None:
+                    fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                    self._file = os.fdopen(fd, "r+b")
+                    fcntl.flock(self._file, fcntl.LOCK_EX)
+                    try:
+                        if os.fstat(fd).st_size < self.size:
+                            os.ftruncate(fd, self.size)
+                    finally:
+                        fcntl.flock(self._file, fcntl.LOCK_UN)
+                    self.map = mmap.mmap(fd, self.size)
+        return self.map
+
+    # Yields the mapping. flock only excludes other processes, threads take
+    # the thread lock.
+    @contextlib.contextmanager
+    def locked(self):
+        shared_map = self.open()
+        with self._thread_lock:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                yield shared_map
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
@@ -0,0 +1,152 @@
+from flask import jsonify
+
+from extensions import db, revocation_cache
+from group_commit import insert_committed
+from models import Products, RevokedToken, Users
+from products import (
+    all_products_query,
+    delete_owned_products_query,
+    owned_product_prices_query,
+    owned_product_query,
+    product_with_owner_as_dict,
+    user_product_as_dict,
+    user_products_query,
+)
+from repository import Repository
+from revocation import exp_to_datetime
+from serializers import model_serializer
+from stats import apply_product_changes, lock_owner_stats, products_inserted
+
+# Endpoints that run their own SQL (search, batches, bulk import/export,
+# stats, images, the change feed) are only served with the SQLAlchemy
+# repository; with the memory repository create_app() answers them with
+# database_required().
+DATABASE_ONLY_BLUEPRINTS = ("stats", "images", "changes")
+DATABASE_ONLY_ENDPOINTS = (
+    "products.search_products",
+    "products.create_products_batch",
+    "products.update_products_batch",
+    "products.delete_products_batch",
+    "products.import_user_products",
+    "products.export_user_products",
+)
+
+product_as_dict = model_serializer(Products)
+
+
+def database_required(**view_args):
+    return jsonify({"message": "Not available with the in-memory repository"}), 501
+
+
+# The default repository, storing users, products and revoked tokens in the
+# database
+class SQLAlchemyRepository(Repository):
+    # Stateless: the engines are reset by factory._reset_after_fork()
+    def reset_after_fork(self):
+        pass
+
+    def get_user(self, user_id):
+        user = db.session.get(Users, user_id)
+        return user.as_dict() if user is not None else None
+
+    def get_user_by_email(self, email):
+        user = Users.query.filter_by(email=email).first()
+        if user is None:
+            return None
+        return dict(user.as_dict(), password=user.password)
+
+    def add_user(self, name, email, gender, password):
+        user = Users(email=email, name=name, gender=gender, password=password)
+        db.session.add(user)
+        db.session.commit()
+        return user.as_dict()
+
+    def set_user_password(self, user_id, password):
+        db.session.execute(
+            db.update(Users).where(Users.id == user_id).values(password=password)
+        )
+        db.session.commit()
+
+    # Through group commit when WRITE_COALESCING is on
+    def add_product(self, values):
+        return insert_committed(Products, values, hook=products_inserted)
+
+    def get_product(self, product_id):
+        product = db.session.get(Products, product_id)
+        return product_as_dict(product) if product is not None else None
+
+    def user_products(self, user_id):
+        return user_product_as_dict.many(
+            db.session.execute(user_products_query(user_id))
+        )
+
+    def all_products(self, after_id=None, limit=None):
+        query = all_products_query(after_id)
+        if limit is not None:
+            query = query.limit(limit)
+        return product_with_owner_as_dict.many(db.session.execute(query))
+
+    # Fetched `chunk_size` rows at a time from a server-side cursor (on
+    # Postgres)
+    def stream_all_products(self, after_id=None, limit=None, chunk_size=500):
+        query = all_products_query(after_id)
+        if limit is not None:
+            query = query.limit(limit)
+        result = db.session.execute(query.execution_options(yield_per=chunk_size))
+        for partition in result.partitions():
+            yield product_with_owner_as_dict.many(partition)
+
+    # A single statement scoped to the owner; a price change reads the old
+    # price for the stats update
+    def update_product(self, product_id, user_id, values):
+        product = owned_product_query(product_id, user_id)
+        if "price" in values:
+            lock_owner_stats(db.session.connection(), user_id)
+            old_price = db.session.execute(
+                owned_product_prices_query([product_id], user_id)
+            ).scalar()
+            found = old_price is not None and product.update(
+                values, synchronize_session=False
+            )
+            if found:
+                apply_product_changes(
+                    db.session.connection(), [(user_id, old_price, values["price"])]
+                )
+        elif values:
+            found = product.update(values, synchronize_session=False)
+        else:
+            found = db.session.query(product.exists()).scalar()
+        if not found:
+            db.session.rollback()
+            return False
+        db.session.commit()
+        return True
+
+    def delete_product(self, product_id, user_id):
+        deleted = db.session.execute(
+            delete_owned_products_query([product_id], user_id).execution_options(
+                synchronize_session=False
+            )
+        ).all()
+        if not deleted:
+            db.session.rollback()
+            return False
+        apply_product_changes(
+            db.session.connection(), [(user_id, deleted[0].price, None)]
+        )
+        db.session.commit()
+        return True
+
+    def revoke_token(self, jti, exp):
+        insert_committed(
+            RevokedToken,
+            {
+                "jti": jti,
+                "expires_at": exp_to_datetime(exp) if exp is not None else None,
+            },
+        )
+        revocation_cache.add(jti, exp)
+
+    # Answered from the in-process mirror of revoked_token
+    def is_token_revoked(self, jti):
+        return revocation_cache.is_revoked(jti)
@@ -0,0 +1,379 @@
+import functools
+from bisect import bisect_left
+from collections import defaultdict
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import jwt_required
+from sqlalchemy import bindparam, case, delete, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from admission import admit
+from extensions import db
+from models import ProductPriceBucket, ProductStats, Products, Users
+from replicas import read_replica
+
+# Upper bounds (inclusive) of the price histogram buckets, plus an overflow
+# bucket. Changing them needs `flask rebuild-product-stats`.
+PRICE_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 5000)
+
+# Catalog statistics served from the product_stats / product_price_buckets
+# summary tables, so reads cost O(owners) whatever the number of products
+bp = Blueprint("stats", __name__)
+
+product_stats = ProductStats.__table__
+product_price_buckets = ProductPriceBucket.__table__
+DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def price_bucket(price):
+    return bisect_left(PRICE_BUCKETS, price)
+
+
+def price_bucket_expression(price):
+    return case(
+        *[(price <= bound, index) for index, bound in enumerate(PRICE_BUCKETS)],
+        else_=len(PRICE_BUCKETS),
+    )
+
+
+# Two-argument least / greatest ignoring NULLs, like Postgres' LEAST and
+# GREATEST (SQLite's scalar min() and max() are NULL if an argument is)
+def _least(dialect_name, a, b):
+    if dialect_name == "postgresql":
+        return func.least(a, b)
+    return func.min(func.coalesce(a, b), func.coalesce(b, a))
+
+
+def _greatest(dialect_name, a, b):
+    if dialect_name == "postgresql":
+        return func.greatest(a, b)
+    return func.max(func.coalesce(a, b), func.coalesce(b, a))
+
+
+# Apply product writes to the summary tables, in the transaction of
+# `connection` and after the products themselves were written. `changes`
+# holds (user_id, old price, new price), old price None for an insert and
+# new price None for a delete.
+#
+# Counts, sums and bucket counts are adjusted by upserts. Adding a price
+# can only lower the min / raise the max; removing the current min or max
+# recomputes it from the owner's products. The owners' stats rows are
+# upserted first, in user_id order, so concurrent writers for the same
+# owner queue up on that row and each recomputation sees the others' rows.
+# The upserts return the new values, so the follow-up statements (min / max
+# recomputation, dropping emptied rows) only run when they are needed.
+def apply_product_changes(connection, changes):
+    totals = defaultdict(lambda: [0, 0.0, None, None])  # count, sum, min, max
+    removed = {}  # user_id -> (lowest, highest) removed price
+    buckets = defaultdict(int)
+    for user_id, old_price, new_price in changes:
+        total = totals[user_id]
+        if old_price is not None:
+            old_price = float(old_price)
+            total[0] -= 1
+            total[1] -= old_price
+            low, high = removed.get(user_id, (old_price, old_price))
+            removed[user_id] = (min(low, old_price), max(high, old_price))
+            buckets[user_id, price_bucket(old_price)] -= 1
+        if new_price is not None:
+            new_price = float(new_price)
+            total[0] += 1
+            total[1] += new_price
+            total[2] = new_price if total[2] is None else min(total[2], new_price)
+            total[3] = new_price if total[3] is None else max(total[3], new_price)
+            buckets[user_id, price_bucket(new_price)] += 1
+    if not totals:
+        return
+
+    statements = _maintenance_statements(connection.dialect.name)
+    updated = connection.execute(
+        statements["upsert_stats"],
+        [
+            {
+                "user_id": user_id,
+                "product_count": count,
+                "price_sum": price_sum,
+                "price_min": price_min,
+                "price_max": price_max,
+            }
+            for user_id, (count, price_sum, price_min, price_max) in sorted(
+                totals.items()
+            )
+        ],
+    ).all()
+
+    emptied = []
+    for row in updated:
+        if row.user_id not in removed:
+            continue
+        low, high = removed[row.user_id]
+        if row.product_count <= 0:
+            emptied.append(row.user_id)
+            continue
+        if row.price_min is not None and row.price_min >= low:
+            connection.execute(statements["recompute_min"], {"owner": row.user_id})
+        if row.price_max is not None and row.price_max <= high:
+            connection.execute(statements["recompute_max"], {"owner": row.user_id})
+
+    changed = [
+        {"user_id": user_id, "bucket": bucket, "product_count": count}
+        for (user_id, bucket), count in sorted(buckets.items())
+        if count
+    ]
+    if changed:
+        empty_buckets = [
+            {"owner": row.user_id, "empty_bucket": row.bucket}
+            for row in connection.execute(statements["upsert_buckets"], changed)
+            if row.product_count <= 0 and row.user_id not in emptied
+        ]
+        if empty_buckets:
+            connection.execute(statements["delete_bucket"], empty_buckets)
+
+    if emptied:
+        connection.execute(
+            delete(product_stats).where(product_stats.c.user_id.in_(emptied))
+        )
+        connection.execute(
+            delete(product_price_buckets).where(
+                product_price_buckets.c.user_id.in_(emptied)
+            )
+        )
+
+
+# The statements of apply_product_changes(), built once per dialect
+@functools.lru_cache
+def _maintenance_statements(dialect_name):
+    insert = DIALECT_INSERTS[dialect_name]
+    owner = bindparam("owner")
+
+    upsert = insert(product_stats)
+    upsert_stats = upsert.on_conflict_do_update(
+        index_elements=[product_stats.c.user_id],
+        set_={
+            "product_count": product_stats.c.product_count
+            + upsert.excluded.product_count,
+            "price_sum": product_stats.c.price_sum + upsert.excluded.price_sum,
+            "price_min": _least(
+                dialect_name, product_stats.c.price_min, upsert.excluded.price_min
+            ),
+            "price_max": _greatest(
+                dialect_name, product_stats.c.price_max, upsert.excluded.price_max
+            ),
+        },
+    ).returning(
+        product_stats.c.user_id,
+        product_stats.c.product_count,
+        product_stats.c.price_min,
+        product_stats.c.price_max,
+    )
+
+    upsert = insert(product_price_buckets)
+    upsert_buckets = upsert.on_conflict_do_update(
+        index_elements=[
+            product_price_buckets.c.user_id,
+            product_price_buckets.c.bucket,
+        ],
+        set_={
+            "product_count": product_price_buckets.c.product_count
+            + upsert.excluded.product_count
+        },
+    ).returning(
+        product_price_buckets.c.user_id,
+        product_price_buckets.c.bucket,
+        product_price_buckets.c.product_count,
+    )
+
+    owned = Products.user_id == owner
+    stats_row = product_stats.c.user_id == owner
+    return {
+        "upsert_stats": upsert_stats,
+        "upsert_buckets": upsert_buckets,
+        "recompute_min": update(product_stats)
+        .where(stats_row)
+        .values(
+            price_min=select(func.min(Products.price)).where(owned).scalar_subquery()
+        ),
+        "recompute_max": update(product_stats)
+        .where(stats_row)
+        .values(
+            price_max=select(func.max(Products.price)).where(owned).scalar_subquery()
+        ),
+        "delete_bucket": delete(product_price_buckets).where(
+            product_price_buckets.c.user_id == owner,
+            product_price_buckets.c.bucket == bindparam("empty_bucket"),
+        ),
+    }
+
+
+# Serialize the writes of an owner whose stats depend on prices read first
+# (updates): a no-op update locks the owner's stats row on Postgres, and
+# takes SQLite's write lock, until the transaction ends. Owners without a
+# stats row have no products to update.
+def lock_owner_stats(connection, user_id):
+    connection.execute(
+        update(product_stats)
+        .where(product_stats.c.user_id == user_id)
+        .values(product_count=product_stats.c.product_count)
+    )
+
+
+# GroupCommitter / insert_committed() hook for new product rows
+def products_inserted(connection, rows):
+    apply_product_changes(
+        connection, [(row["user_id"], None, row["price"]) for row in rows]
+    )
+
+
+# Recompute the summary tables from the products table, for the given owners
+# or all of them. Also corrects the float drift of the incremental sums.
+def rebuild_product_stats(connection, user_ids=None):
+    stats_rows = delete(product_stats)
+    bucket_rows = delete(product_price_buckets)
+    products = select(Products.user_id).group_by(Products.user_id)
+    bucket = price_bucket_expression(Products.price)
+    buckets = select(Products.user_id, bucket, func.count()).group_by(
+        Products.user_id, bucket
+    )
+    if user_ids is not None:
+        stats_rows = stats_rows.where(product_stats.c.user_id.in_(user_ids))
+        bucket_rows = bucket_rows.where(product_price_buckets.c.user_id.in_(user_ids))
+        products = products.where(Products.user_id.in_(user_ids))
+        buckets = buckets.where(Products.user_id.in_(user_ids))
+
+    connection.execute(stats_rows)
+    connection.execute(bucket_rows)
+    connection.execute(
+        product_stats.insert().from_select(
+            ["user_id", "product_count", "price_sum", "price_min", "price_max"],
+            products.add_columns(
+                func.count(),
+                func.sum(Products.price),
+                func.min(Products.price),
+                func.max(Products.price),
+            ),
+        )
+    )
+    connection.execute(
+        product_price_buckets.insert().from_select(
+            ["user_id", "bucket", "product_count"], buckets
+        )
+    )
+
+
+def histogram(counts):
+    return [
+        {"le": bound, "count": counts.get(index, 0)}
+        for index, bound in enumerate(PRICE_BUCKETS + (None,))
+    ]
+
+
+def summary(product_count, price_sum, price_min, price_max):
+    return {
+        "product_count": product_count or 0,
+        "price_sum": price_sum or 0.0,
+        "price_avg": price_sum / product_count if product_count else None,
+        "price_min": price_min,
+        "price_max": price_max,
+    }
+
+
+# Catalog-wide totals and price histogram
+@bp.route("/api/stats", methods=["GET"])
+@admit("listings")
+@read_replica
+@jwt_required()
+def get_catalog_stats():
+    totals = db.session.execute(
+        select(
+            func.count(),
+            func.sum(product_stats.c.product_count),
+            func.sum(product_stats.c.price_sum),
+            func.min(product_stats.c.price_min),
+            func.max(product_stats.c.price_max),
+        )
+    ).one()
+    counts = dict(
+        db.session.execute(
+            select(
+                product_price_buckets.c.bucket,
+                func.sum(product_price_buckets.c.product_count),
+            ).group_by(product_price_buckets.c.bucket)
+        ).all()
+    )
+    stats = summary(*totals[1:])
+    stats["owners"] = totals[0]
+    stats["price_histogram"] = histogram(counts)
+    return jsonify(stats), 200
+
+
+# Per-owner stats, by owner id; `after_id` and `limit` page through them
+@bp.route("/api/stats/owners", methods=["GET"])
+@admit("listings")
+@read_replica
+@jwt_required()
+def get_owner_stats():
+    after_id = request.args.get("after_id", type=int)
+    limit = request.args.get("limit", type=int)
+    if limit is not None and limit < 1:
+        return jsonify({"message": "limit must be a positive integer"}), 400
+
+    query = owner_stats_query()
+    if after_id is not None:
+        query = query.where(product_stats.c.user_id > after_id)
+    if limit is not None:
+        query = query.limit(min(limit, current_app.config["PRODUCTS_PAGE_MAX_LIMIT"]))
+    owners = db.session.execute(query).all()
+
+    buckets = defaultdict(dict)
+    if owners:
+        for user_id, bucket, count in db.session.execute(
+            select(product_price_buckets).where(
+                product_price_buckets.c.user_id.between(
+                    owners[0].user_id, owners[-1].user_id
+                )
+            )
+        ):
+            buckets[user_id][bucket] = count
+
+    response = jsonify([owner_stats(owner, buckets[owner.user_id]) for owner in owners])
+    if limit is not None and len(owners) == limit:
+        response.headers["X-Next-After-Id"] = str(owners[-1].user_id)
+    return response, 200
+
+
+# Stats of one owner
+@bp.route("/api/stats/owners/<int:user_id>", methods=["GET"])
+@admit("listings")
+@read_replica
+@jwt_required()
+def get_one_owner_stats(user_id):
+    owner = db.session.execute(
+        owner_stats_query().where(product_stats.c.user_id == user_id)
+    ).one_or_none()
+    if owner is None:
+        return jsonify({"message": "No products found for this owner"}), 404
+    counts = dict(
+        db.session.execute(
+            select(
+                product_price_buckets.c.bucket, product_price_buckets.c.product_count
+            ).where(product_price_buckets.c.user_id == user_id)
+        ).all()
+    )
+    return jsonify(owner_stats(owner, counts)), 200
+
+
+def owner_stats_query():
+    return (
+        select(product_stats, Users.name.label("owner"))
+        .join(Users, Users.id == product_stats.c.user_id)
+        .order_by(product_stats.c.user_id)
+    )
+
+
+def owner_stats(row, bucket_counts):
+    stats = {"user_id": row.user_id, "owner": row.owner}
+    stats.update(
+        summary(row.product_count, row.price_sum, row.price_min, row.price_max)
+    )
+    stats["price_histogram"] = histogram(bucket_counts)
+    return stats
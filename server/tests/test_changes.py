@@ -0,0 +1,64 @@
+import pytest
+
+from changes import ensure_change_feed_schema
+from extensions import db
+from factory import create_app
+from models import Products
+
+
+@pytest.fixture
+def client(tmp_path):
+    app = create_app(
+        {
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}",
+            "PASSWORD_HASH_WORKERS": 0,
+            "ADMISSION_CONTROL": False,
+            "RESPONSE_CACHE_SHARED_PATH": "",
+        }
+    )
+    with app.app_context():
+        db.create_all()
+        ensure_change_feed_schema(db.session.connection())
+        db.session.commit()
+    return app.test_client()
+
+
+def register(client, name):
+    response = client.post(
+        "/api/register",
+        json={"name": name, "email": f"{name}@example.com", "gender": "x",
+              "password": "password"},
+    )
+    return {"Authorization": f"Bearer {response.get_json()['access_token']}"}
+
+
+# A deleted product's id taken by another user's product (as SQLite did
+# before products had sqlite_autoincrement): the first owner's feed has the
+# deletion, and never the new product
+def test_deleted_product_id_reused_by_another_user(client):
+    alice = register(client, "alice")
+    bob = register(client, "bob")
+    client.post("/api/products", headers=alice, json={"name": "a", "price": 1})
+    cursor = client.get("/api/products/changes", headers=alice).get_json()["cursor"]
+    client.delete("/api/products/1", headers=alice)
+    with client.application.app_context():
+        db.session.add(Products(id=1, name="b-private", price=1, user_id=2))
+        db.session.commit()
+
+    feed = client.get(
+        f"/api/products/changes?since={cursor}", headers=alice
+    ).get_json()
+    assert feed["changed"] == []
+    assert feed["deleted"] == [1]
+
+    feed = client.get("/api/products/changes?scope=all", headers=bob).get_json()
+    assert [product["owner"] for product in feed["changed"]] == ["bob"]
+
+
+def test_deleted_product_id_is_not_reused(client):
+    alice = register(client, "alice")
+    client.post("/api/products", headers=alice, json={"name": "a", "price": 1})
+    client.delete("/api/products/1", headers=alice)
+    client.post("/api/products", headers=alice, json={"name": "b", "price": 1})
+    products = client.get("/api/products", headers=alice).get_json()
+    assert [product["id"] for product in products] == [2]
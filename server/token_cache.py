@@ -0,0 +1,60 @@
+import hashlib
+import time
+
+from flask import current_app
+from flask_jwt_extended import JWTManager
+
+from caching import TTLCache
+
+
+# JWTManager that remembers the claims of tokens it has already verified.
+#
+# Every @jwt_required() request otherwise parses the token twice (once
+# unverified to pick the key), checks its HMAC and parses its JSON claims.
+# Verified claims are kept in an LRU keyed by the token's SHA-256 digest
+# until the token's `exp`, so repeat requests with the same token skip all of
+# that. Revocation is unaffected: the blocklist loader still runs on every
+# request, on the cached claims.
+#
+# Tokens without `exp`, cookie tokens (CSRF double submit) and decodes that
+# allow expired tokens always go through the full verification. Each app
+# has its own cache of JWT_DECODE_CACHE_SIZE tokens (0 turns it off).
+class CachingJWTManager(JWTManager):
+    def init_app(self, app, **kwargs):
+        super().init_app(app, **kwargs)
+        app.config.setdefault("JWT_DECODE_CACHE_SIZE", 10000)
+        app.extensions["jwt_decode_cache"] = TTLCache(
+            maxsize=app.config["JWT_DECODE_CACHE_SIZE"]
+        )
+
+    @property
+    def decode_cache(self):
+        return current_app.extensions["jwt_decode_cache"]
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None,
+                                allow_expired=False):
+        if csrf_value is not None or allow_expired:
+            return super()._decode_jwt_from_config(
+                encoded_token, csrf_value, allow_expired
+            )
+
+        key = token_digest(encoded_token)
+        claims = self.decode_cache.get(key)
+        if claims is not None:
+            if claims["exp"] > time.time():
+                return dict(claims)
+            self.decode_cache.pop(key)
+
+        claims = super()._decode_jwt_from_config(encoded_token)
+        exp = claims.get("exp")
+        if exp is not None:
+            ttl = exp - time.time()
+            if ttl > 0:
+                self.decode_cache.set(key, dict(claims), ttl=ttl)
+        return claims
+
+
+def token_digest(encoded_token):
+    if isinstance(encoded_token, str):
+        encoded_token = encoded_token.encode()
+    return hashlib.sha256(encoded_token).digest()
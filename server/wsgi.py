@@ -0,0 +1,6 @@
+# WSGI entry point, e.g. `gunicorn --preload --workers 4 --threads 8 wsgi:app`.
+# The app can be preloaded in the master: connections and worker pools are
+# only opened after the fork, see factory.create_app().
+from factory import create_app
+
+app = create_app()